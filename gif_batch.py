@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import freeze_support
+
+from gif_engine import (FrameStore, AnnotationIndex, ExportJob, ExportCache, DEFAULT_WEBM_SETTINGS, WEBM_CODECS, EDITS_FILE_NAME,
+                        edits_path, load_edits, timeline_from_edits, export_variants, TARGET_SIZE_MB, DUPLICATE_THRESHOLD)
+
+# --- Configuration ---
+BATCH_WORKERS = max(1, (os.cpu_count() or 1) // 2) # Each project already annotates on several threads
+OUTPUT_NAMES = {'gif': "{}.gif", 'gif_small': "{}_small.gif", 'webm': "{}.webm", 'poster': "{}.png"}
+PROGRESS_INTERVAL_S = 0.5
+VARIABLE_DELAY_OUTPUTS = ('gif', 'gif_small', 'apng', 'webp') # Folded frames save bytes only where a frame can carry a longer delay
+
+
+def output_stem(source_path):
+    return os.path.splitext(os.path.basename(os.path.normpath(source_path)))[0]
+
+def write_progress(path, progress):
+    # Replaced in one move so a reader never sees half a file
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(path + '.tmp', path)
+
+def _report_progress(path, job, stop_event):
+    while not stop_event.wait(PROGRESS_INTERVAL_S):
+        try: write_progress(path, {'stage': job.stage, 'done': job.done, 'total': job.total})
+        except OSError: pass
+
+def export_project(source_path, output_dir, formats, edits_file=None, target_mb=TARGET_SIZE_MB,
+                   fold_threshold=DUPLICATE_THRESHOLD, webm_settings=DEFAULT_WEBM_SETTINGS, use_cache=True, progress_path=None):
+    """Exports one project folder or GIF in the calling process. Returns a JSON-ready report, never raises.
+    With progress_path, the job's stage and done/total counts are written there every PROGRESS_INTERVAL_S."""
+    report = {'input': source_path, 'outputs': {}}
+    started = time.perf_counter()
+    try:
+        if edits_file is None and os.path.exists(edits_path(source_path)): edits_file = edits_path(source_path)
+        report['edits'] = edits_file
+        store = FrameStore.open(source_path)
+        timeline, events = timeline_from_edits(store, load_edits(edits_file) if edits_file else {})
+        if not len(timeline): raise ValueError("No frames left after the edits.")
+        height, width = timeline.frame(0).shape[:2]
+        report.update(frames=len(timeline), width=width, height=height, duration_s=timeline.time_at(len(timeline)))
+        report['load_s'] = round(time.perf_counter() - started, 3)
+
+        os.makedirs(output_dir, exist_ok=True)
+        stem = output_stem(source_path)
+        outputs = {name: os.path.join(output_dir, OUTPUT_NAMES[name].format(stem)) for name in formats}
+        if os.path.abspath(outputs.get('gif', '')) == os.path.abspath(source_path):
+            outputs['gif'] = os.path.join(output_dir, f"{stem}_edited.gif") # Never overwrite the source GIF
+
+        export_started = time.perf_counter()
+        job = ExportJob(None, total=len(timeline))
+        stop_progress = threading.Event()
+        if progress_path: threading.Thread(target=_report_progress, args=(progress_path, job, stop_progress), daemon=True).start()
+        try:
+            results = export_variants(timeline, AnnotationIndex(events), job, outputs, int(target_mb * 1024 * 1024),
+                                      webm_settings=webm_settings, fold_threshold=fold_threshold, cache=ExportCache() if use_cache else None)
+        finally:
+            stop_progress.set()
+        report['export_s'] = round(time.perf_counter() - export_started, 3)
+        for name, result in results.items():
+            if 'error' in result:
+                report['outputs'][name] = {'error': str(result['error'])}
+                continue
+            report['outputs'][name] = {'path': result['path'], 'bytes': result['bytes'], 'cached': result.get('cached', False)}
+            if name in VARIABLE_DELAY_OUTPUTS: report['outputs'][name]['folded_frames'] = result['folded_frames']
+            if result.get('full_quality'): report['outputs'][name]['full_quality'] = True # Already fit the budget, same GIF as 'gif'
+    except Exception as e:
+        report['error'] = f"{type(e).__name__}: {e}"
+    report['total_s'] = round(time.perf_counter() - started, 3)
+    return report
+
+def _emit(line):
+    # Windowed (frozen) builds have no console
+    if sys.stdout is None: return
+    print(line, flush=True)
+
+def run_batch(sources, output_dir=None, formats=('gif',), edits_file=None, workers=BATCH_WORKERS, **options):
+    """Exports every source across worker processes. Prints one JSON line per finished project and returns all reports."""
+    started = time.perf_counter()
+    jobs = [(source, output_dir or os.path.dirname(os.path.abspath(os.path.normpath(source)))) for source in sources]
+    reports = []
+    if workers <= 1 or len(jobs) == 1:
+        for source, destination in jobs:
+            reports.append(export_project(source, destination, formats, edits_file, **options))
+            _emit(json.dumps(reports[-1]))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(export_project, source, destination, formats, edits_file, **options) for source, destination in jobs]
+            for future in as_completed(futures):
+                reports.append(future.result())
+                _emit(json.dumps(reports[-1]))
+    order = {source: i for i, source in enumerate(sources)}
+    reports.sort(key=lambda report: order[report['input']])
+    summary = {'projects': len(reports), 'failed': sum(1 for r in reports if 'error' in r),
+               # A full_quality gif_small is the 'gif' file again, it is counted once
+               'bytes': sum(out.get('bytes', 0) for r in reports for out in r['outputs'].values() if not out.get('full_quality')),
+               'wall_s': round(time.perf_counter() - started, 3), 'workers': workers}
+    _emit(json.dumps({'summary': summary}))
+    return reports, summary
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="gif_editor --batch", description="Exports project folders or GIFs without opening the editor.")
+    parser.add_argument('sources', nargs='+', help="Project folders (JPG frames) or GIF files")
+    parser.add_argument('-o', '--output-dir', help="Destination folder (default: next to each source)")
+    parser.add_argument('-f', '--formats', default='gif', help=f"Comma separated list among {', '.join(OUTPUT_NAMES)} (default: gif)")
+    parser.add_argument('-e', '--edits', help=f"Edits JSON applied to every source (default: each source's own {EDITS_FILE_NAME} if present)")
+    parser.add_argument('-j', '--workers', type=int, default=BATCH_WORKERS, help=f"Projects exported in parallel (default: {BATCH_WORKERS})")
+    parser.add_argument('--target-mb', type=float, default=TARGET_SIZE_MB, help="Size budget of gif_small in MB")
+    parser.add_argument('--fold', type=int, default=DUPLICATE_THRESHOLD, help="Duplicate frame threshold, -1 to keep every frame")
+    parser.add_argument('--webm-codec', choices=sorted(WEBM_CODECS), default=DEFAULT_WEBM_SETTINGS.codec)
+    parser.add_argument('--webm-crf', type=int, default=DEFAULT_WEBM_SETTINGS.crf)
+    parser.add_argument('--no-cache', action='store_true', help="Encode everything again instead of reusing identical earlier exports")
+    parser.add_argument('--progress', help="Single source only: keep this JSON file updated with the export stage and frame counts")
+    parser.add_argument('--report', help="Also write all reports and the summary to this JSON file")
+    args = parser.parse_args(argv)
+    args.formats = tuple(name.strip() for name in args.formats.split(',') if name.strip())
+    unknown = [name for name in args.formats if name not in OUTPUT_NAMES]
+    if unknown: parser.error(f"unknown format(s): {', '.join(unknown)}")
+    if args.progress and len(args.sources) > 1: parser.error("--progress needs a single source")
+    return args
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    webm_settings = DEFAULT_WEBM_SETTINGS._replace(codec=args.webm_codec, crf=args.webm_crf)
+    reports, summary = run_batch(args.sources, args.output_dir, args.formats, args.edits, args.workers, target_mb=args.target_mb,
+                                 fold_threshold=args.fold if args.fold >= 0 else None, webm_settings=webm_settings,
+                                 use_cache=not args.no_cache, progress_path=args.progress)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'reports': reports, 'summary': summary}, f, indent=2)
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
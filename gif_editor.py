@@ -1,17 +1,27 @@
+import gif_startup # First: starts the --profile-startup clock
 import subprocess
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-from PIL import Image, ImageTk, ImageDraw, ImageFont
-import imageio.v2 as imageio
+from PIL import Image, ImageTk
 import os
 import sys
-import win32clipboard
-import win32con
 import tempfile
 import time
 import struct
-import numpy as np
+import json
 import shutil
+import threading
+import queue
+from collections import OrderedDict
+from multiprocessing import freeze_support
+from multiprocessing.connection import Listener
+from gif_engine import (FrameStore, Timeline, AnnotationIndex, ExportJob, ExportCancelled, DuplicateFolder, get_annotation_font, export_stream, export_gif_to_size, export_variants,
+                        activity_segments, union_box, pad_box, motion_energy, active_span, AUTO_TRIM_MARGIN_MS,
+                        ExportCache, edits_path, load_edits, save_edits, timeline_from_edits, edits_from_timeline,
+                        write_webm, write_webp, write_apng, WebmSettings, DEFAULT_WEBM_SETTINGS, WEBM_CODECS, WEBM_DEADLINES, PREFETCH_COUNT, FRAME_DURATION_MS,
+                        TARGET_SIZE_MB, DUPLICATE_THRESHOLD)
+# win32clipboard is imported by the two clipboard functions, it is not needed to show the first frame
+gif_startup.mark("imports")
 
 class Tooltip:
     def __init__(self, widget, text):
@@ -48,6 +58,21 @@ EDITOR_WIDTH = 1000
 EDITOR_HEIGHT = 800
 BLANK_CANVAS_COLOR = "#1E1E1E"
 ANNOTATION_COLOR = "#FFA500"
+ANNOTATION_DURATION_MS = 1000 # Display time of a new pencil or text annotation, whatever the frame durations
+DISPLAY_CACHE_SIZE = 48 # Display-sized frames kept for instant revisits
+SCRUB_SETTLE_MS = 150 # Quiet time after a slider move before the high-quality render
+WEBP_LOSSLESS = False # Lossy WebP is about half the size of the GIF on recorded (JPEG) frames
+WEBP_QUALITY = 80
+DELTA_TOLERANCE = 8 # APNG/lossless WebP: per-channel change ignored between frames, hides the JPEG noise of captures
+EXPORT_VARIANTS = ('gif', 'gif_small', 'webm', 'poster') # Outputs encoded together by the GIF export
+MARKER_CANVAS_HEIGHT = 24 # Annotation markers on top, motion energy curve below
+ENERGY_COLOR = "#4A90D9"
+SESSION_SAVE_DELAY_MS = 1000 # Edits are written next to the project once the user pauses
+EDITOR_HOST_ENV = "GIF_EDITOR_HOST" # "<address>|<hex authkey>" given by the recorder to a warm host (--host)
+REQUESTED_AT_ENV = "GIF_EDITOR_REQUESTED_AT" # time.time() of the click that asked for a cold-started editor
+HOST_POLL_MS = 20
+BUTTON_ICON_SIZE = (24, 24)
+_button_icons = {} # filename -> PhotoImage, shared by the windows of a warm host
 
 def resource_path(relative_path):
     try:
@@ -74,6 +99,7 @@ def copy_file_to_clipboard(file_path):
         file_path_bytes = (abs_path + '\0\0').encode('utf-16-le')
         drop_files_struct = struct.pack('<IIIII', 20, 0, 0, 0, 1)
         clipboard_data = drop_files_struct + file_path_bytes
+        import win32clipboard, win32con
         win32clipboard.OpenClipboard()
         win32clipboard.EmptyClipboard()
         win32clipboard.SetClipboardData(win32con.CF_HDROP, clipboard_data)
@@ -84,20 +110,28 @@ def copy_file_to_clipboard(file_path):
 
 
 class GifEditorApp:
-    def __init__(self, master):
+    def __init__(self, master, path=None, requested_at=None, shared=None):
         self.master = master
+        self.path = path # None: first command line argument, else the clipboard
+        self.shared = shared # Descriptor of the frames of project `path` handed over in shared memory by the recorder
+        self.requested_at = requested_at # Click time, the first displayed frame logs the latency from it
         master.title("Gif Editor")
         master.geometry(f"{EDITOR_WIDTH}x{EDITOR_HEIGHT}")
         master.config(bg="#2E2E2E")
         set_dark_title_bar(master)
 
-        self.gif_frames, self.edit_events, self.redo_stack = [], [], []
+        self.edit_events, self.undo_stack, self.redo_stack = [], [], [] # Stacks hold annotation, timeline and crop actions
+        self.frame_store = None
+        self.timeline = Timeline(None, entries=[]) # Edit decision list over frame_store
+        self.annotation_index = AnnotationIndex() # Committed edit_events, bucketed by frame
         self.current_frame_index = 0
+        self.is_loading, self.load_start_time, self.load_status_text = False, 0, ""
         self.photo_image, self.original_gif_path = None, None
+        self.display_cache = OrderedDict()
+        self.frame_image_id, self.live_text_id = None, None # Persistent canvas items
+        self.render_after_id, self.settle_after_id = None, None
         self.last_x, self.last_y, self.current_drawing_segments = None, None, None
         self.pencil_color = ANNOTATION_COLOR
-        self.marker_positions = []
-        self.redo_marker_positions = []
         self.crop_start_x, self.crop_start_y = 0, 0
         self.crop_rect_id = None
         self.crop_coords = None
@@ -111,6 +145,11 @@ class GifEditorApp:
         self.current_text_string = ""
         self.current_text_position = (0, 0)
         self.current_text_font_size = 20
+        self.webm_settings = DEFAULT_WEBM_SETTINGS
+        self.motion_energy = {} # (previous source, source) -> share of changed pixels, survives timeline edits
+        self.motion_job = None # Background measure started once the clip is loaded
+        self.source_path, self.session_after_id = None, None # Edits are saved to edits_path(source_path)
+        self.export_cache = ExportCache()
 
         self.button_frame = None
         self.timeline_frame = None
@@ -122,7 +161,12 @@ class GifEditorApp:
         self.status_label = tk.Label(master, text="Chargez un GIF...", bg="#2E2E2E", fg="white")
         self.status_label.pack(pady=5, side=tk.BOTTOM, fill=tk.X)
 
-        self.master.after(100, self.load_gif_from_cli_or_clipboard)
+        if path:
+            self.master.update_idletasks() # Canvas size is known, the first frame can be drawn right away
+            self.load_gif_from_cli_or_clipboard()
+        else:
+            self.master.after(100, self.load_gif_from_cli_or_clipboard)
+        master.protocol("WM_DELETE_WINDOW", self.close_editor)
         master.bind("<Control-z>", self.undo); master.bind("<Control-y>", self.redo)
         master.bind("<Escape>", self.handle_escape)
         self.master.bind("<Key>", self.handle_text_keypress)
@@ -144,9 +188,10 @@ class GifEditorApp:
 
         for name, filename in icon_files.items():
             try:
-                path = os.path.join(icon_folder, filename)
-                img = Image.open(path).resize((24, 24), Image.LANCZOS) # Resize to 24x24 for consistency
-                self.icons[name] = ImageTk.PhotoImage(img)
+                if filename not in _button_icons:
+                    # Resized to 24x24 for consistency, the resized copy is cached on disk
+                    _button_icons[filename] = ImageTk.PhotoImage(gif_startup.load_sized_icon(os.path.join(icon_folder, filename), BUTTON_ICON_SIZE))
+                self.icons[name] = _button_icons[filename]
             except Exception as e:
                 print(f"Error loading icon {filename}: {e}")
                 self.icons[name] = None # Placeholder
@@ -161,6 +206,19 @@ class GifEditorApp:
         webm_btn.pack(side=tk.RIGHT, padx=2)
         Tooltip(webm_btn, "Valider en WebM (Plus léger)")
 
+        webm_settings_btn = tk.Button(export_frame, text="⚙", relief=tk.FLAT, bg="#2E2E2E", fg="white", command=self.choose_webm_settings)
+        webm_settings_btn.pack(side=tk.RIGHT, padx=2)
+        Tooltip(webm_settings_btn, "Réglages de l'encodage WebM")
+
+        # WebP and APNG Buttons
+        webp_btn = tk.Button(export_frame, text="WebP", image=self.icons.get("validate"), compound=tk.LEFT, relief=tk.FLAT, bg="#2E2E2E", fg="white", command=self.export_as_webp)
+        webp_btn.pack(side=tk.RIGHT, padx=2)
+        Tooltip(webp_btn, "Valider en WebP animé (léger, s'affiche comme une image)")
+
+        apng_btn = tk.Button(export_frame, text="APNG", image=self.icons.get("validate"), compound=tk.LEFT, relief=tk.FLAT, bg="#2E2E2E", fg="white", command=self.export_as_apng)
+        apng_btn.pack(side=tk.RIGHT, padx=2)
+        Tooltip(apng_btn, "Valider en PNG animé")
+
         # GIF Button (formerly Validate)
         gif_btn = tk.Button(export_frame, text="GIF", image=self.icons.get("validate"), compound=tk.LEFT, relief=tk.FLAT, bg="#2E2E2E", fg="white", command=self.export_as_gif)
         gif_btn.pack(side=tk.RIGHT, padx=2)
@@ -194,6 +252,14 @@ class GifEditorApp:
         crop_btn = tk.Button(self.button_frame, image=self.icons.get("crop"), relief=tk.FLAT, bg="#2E2E2E", command=self.enter_crop_mode)
         crop_btn.pack(side=tk.LEFT, padx=2)
         Tooltip(crop_btn, "Définir une nouvelle zone de selection de l'image")
+
+        auto_crop_btn = tk.Menubutton(self.button_frame, text="Auto-crop", fg="white", bg="#2E2E2E", activebackground="#3E3E3E", activeforeground="white", relief=tk.FLAT)
+        auto_crop_menu = tk.Menu(auto_crop_btn, tearoff=0, bg="#2E2E2E", fg="white")
+        auto_crop_menu.add_command(label="Activité de toute la séquence", command=lambda: self.auto_crop(segment_only=False))
+        auto_crop_menu.add_command(label="Activité du segment en cours", command=lambda: self.auto_crop(segment_only=True))
+        auto_crop_btn.config(menu=auto_crop_menu)
+        auto_crop_btn.pack(side=tk.LEFT, padx=2)
+        Tooltip(auto_crop_btn, "Recadrer sur la zone qui bouge (toute la séquence ou le segment en cours)")
         
         # Crop confirmation buttons (re-using validate icon)
         self.confirm_crop_button = tk.Button(self.button_frame, image=self.icons.get("validate"), relief=tk.FLAT, bg="#28a745", command=self.confirm_crop)
@@ -203,7 +269,7 @@ class GifEditorApp:
 
         duplicate_btn = tk.Button(self.button_frame, image=self.icons.get("duplicate"), relief=tk.FLAT, bg="#2E2E2E", command=self.duplicate_current_frame)
         duplicate_btn.pack(side=tk.LEFT, padx=2)
-        Tooltip(duplicate_btn, "Duppliquer l'image en cours")
+        Tooltip(duplicate_btn, "Maintenir l'image en cours (+1 image de durée)")
 
         delete_btn = tk.Button(self.button_frame, image=self.icons.get("delete"), relief=tk.FLAT, bg="#2E2E2E", command=self.delete_current_frame)
         delete_btn.pack(side=tk.LEFT, padx=2)
@@ -213,6 +279,10 @@ class GifEditorApp:
         slowmo_btn.pack(side=tk.LEFT, padx=2)
         Tooltip(slowmo_btn, "Effectuer un Ralentis SlowMotion")
 
+        speed_ramp_btn = tk.Button(self.button_frame, text="Vitesse", fg="white", bg="#2E2E2E", relief=tk.FLAT, command=self.choose_speed_ramp)
+        speed_ramp_btn.pack(side=tk.LEFT, padx=2)
+        Tooltip(speed_ramp_btn, "Rampe de vitesse à partir de l'image en cours")
+
         trim_start_btn = tk.Button(self.button_frame, image=self.icons.get("trim_start"), relief=tk.FLAT, bg="#2E2E2E", command=self.delete_first_frames)
         trim_start_btn.pack(side=tk.LEFT, padx=2)
         Tooltip(trim_start_btn, "Supprimer les 3 premières images du début")
@@ -221,12 +291,22 @@ class GifEditorApp:
         trim_end_btn.pack(side=tk.LEFT, padx=2)
         Tooltip(trim_end_btn, "Supprimer les 3 dernières images de fin")
 
+        auto_trim_btn = tk.Menubutton(self.button_frame, text="Auto-trim", fg="white", bg="#2E2E2E", activebackground="#3E3E3E", activeforeground="white", relief=tk.FLAT)
+        auto_trim_menu = tk.Menu(auto_trim_btn, tearoff=0, bg="#2E2E2E", fg="white")
+        auto_trim_menu.add_command(label="Afficher la courbe de mouvement", command=self.analyze_motion)
+        auto_trim_menu.add_command(label="Couper les temps morts", command=self.auto_trim)
+        auto_trim_btn.config(menu=auto_trim_menu)
+        auto_trim_btn.pack(side=tk.LEFT, padx=2)
+        Tooltip(auto_trim_btn, "Courbe de mouvement sous la timeline, ou couper les temps morts du début et de la fin")
+
     def setup_timeline(self):
         self.timeline_frame = tk.Frame(self.master, bg="#2E2E2E")
         self.timeline_frame.pack(pady=5, side=tk.BOTTOM, fill=tk.X, padx=10)
         
-        self.marker_canvas = tk.Canvas(self.timeline_frame, height=5, bg="#2E2E2E", highlightthickness=0)
+        self.marker_canvas = tk.Canvas(self.timeline_frame, height=MARKER_CANVAS_HEIGHT, bg="#2E2E2E", highlightthickness=0)
         self.marker_canvas.pack(fill=tk.X, padx=10)
+        self.marker_canvas.bind("<Button-1>", self.on_marker_click)
+        self.marker_canvas.bind("<Configure>", lambda e: self.update_timeline_markers())
 
         self.timeline_label = tk.Label(self.timeline_frame, text="0.0s", bg="#2E2E2E", fg="white", width=6)
         self.timeline_label.pack(side=tk.LEFT)
@@ -263,7 +343,7 @@ class GifEditorApp:
         return cx, cy
 
     def load_gif_from_cli_or_clipboard(self):
-        path_arg = sys.argv[1] if len(sys.argv) > 1 else self.get_clipboard_file_path()
+        path_arg = self.path or (sys.argv[1] if len(sys.argv) > 1 else self.get_clipboard_file_path())
         
         if not path_arg or not os.path.exists(path_arg):
             self.display_blank_canvas()
@@ -273,90 +353,216 @@ class GifEditorApp:
             if os.path.isdir(path_arg):
                 # It's a project folder, load JPGs
                 self.original_gif_path = os.path.join(path_arg, 'edited.gif') # Tentative output path
-                jpg_files = sorted([os.path.join(path_arg, f) for f in os.listdir(path_arg) if f.lower().endswith(".jpg")])
-                if not jpg_files:
-                    raise ValueError("No .jpg frames found in the project folder.")
+                try:
+                    # Fresh capture: the recorder is still writing the JPGs, its frames are read in place
+                    self.frame_store = FrameStore.from_shared_memory(self.shared) if self.shared else None
+                except FileNotFoundError:
+                    self.frame_store = None # Released by the recorder in the meantime, the JPGs are on disk
+                if self.frame_store is None:
+                    # Frames are decoded on demand, only the file list is read here
+                    self.frame_store = FrameStore.from_project_folder(path_arg)
+                self.timeline = Timeline(self.frame_store)
                 
-                # Read images as numpy arrays
-                self.gif_frames = [imageio.imread(f) for f in jpg_files]
-                
-                self.status_label.config(text=f"Projet {os.path.basename(path_arg)} - {len(self.gif_frames)} images")
+                self.status_label.config(text=f"Projet {os.path.basename(path_arg)} - {len(self.timeline)} images")
 
             elif path_arg.lower().endswith('.gif'):
                 # It's a GIF file
                 self.original_gif_path = path_arg
-                self.gif_frames = list(imageio.get_reader(path_arg, mode='I'))
-                self.status_label.config(text=f"{os.path.basename(path_arg)} - {len(self.gif_frames)} images")
+                self.frame_store = FrameStore.from_gif(path_arg)
+                self.timeline = Timeline(self.frame_store)
+                self.status_label.config(text=f"{os.path.basename(path_arg)} - {len(self.timeline)} images")
 
             else:
                 self.status_label.config(text=f"Unsupported file or folder: {path_arg}")
                 self.display_blank_canvas()
                 return
 
-            self.timeline_slider.config(to=len(self.gif_frames) - 1)
+            self.source_path = path_arg
+            self.restore_session()
+            self.timeline_slider.config(to=len(self.timeline) - 1)
             self.on_slider_move(0)
             self.update_timeline_markers()
+            self.start_progressive_load()
 
         except Exception as e:
             self.status_label.config(text=f"Erreur chargement: {e}")
             self.display_blank_canvas()
 
+    def restore_session(self):
+        """Reloads the edits saved for this project, if any. Undo history starts empty."""
+        path = edits_path(self.source_path)
+        if not os.path.exists(path): return
+        try:
+            timeline, events = timeline_from_edits(self.frame_store, load_edits(path))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"DEBUG: Session ignorée ({path}): {e}")
+            return
+        self.timeline, self.edit_events = timeline, events
+        self.annotation_index = AnnotationIndex(events)
+        self.status_label.config(text=f"{self.status_label.cget('text')} - modifications précédentes restaurées")
+
+    def schedule_session_save(self):
+        if not self.source_path: return
+        if self.session_after_id: self.master.after_cancel(self.session_after_id)
+        self.session_after_id = self.master.after(SESSION_SAVE_DELAY_MS, self.save_session)
+
+    def save_session(self):
+        self.session_after_id = None
+        try:
+            save_edits(edits_path(self.source_path), edits_from_timeline(self.timeline, self.edit_events))
+        except OSError as e:
+            print(f"DEBUG: Sauvegarde de la session impossible: {e}")
+
+    def discard_session(self):
+        if self.session_after_id: self.master.after_cancel(self.session_after_id)
+        self.session_after_id = None
+        path = edits_path(self.source_path)
+        if os.path.exists(path): os.remove(path)
+        self.source_path = None
+
+    def close_editor(self):
+        if self.session_after_id:
+            self.master.after_cancel(self.session_after_id)
+            self.save_session()
+        # A warm host outlives this window, the decoded clip must not
+        if self.motion_job: self.motion_job.cancel()
+        if self.frame_store: self.frame_store.close()
+        self.master.destroy()
+
+    def start_progressive_load(self):
+        # Clips that fit in the frame cache are fully decoded in the background, larger ones stay lazy
+        if not self.frame_store.fits_in_cache(): return
+        self.is_loading = True
+        self.load_start_time = time.time()
+        self.load_status_text = self.status_label.cget("text")
+        threading.Thread(target=self.frame_store.preload, daemon=True).start()
+        self.master.after(100, self.poll_progressive_load)
+
+    def poll_progressive_load(self):
+        if not self.frame_store: return
+        loaded, total = self.frame_store.loaded_count, len(self.frame_store)
+        elapsed = max(time.time() - self.load_start_time, 1e-6)
+        if loaded < total:
+            # Only the already-decoded part of the timeline is reachable while loading
+            available = next((i for i, entry in enumerate(self.timeline.entries) if entry.source >= loaded), len(self.timeline))
+            self.timeline_slider.config(to=max(0, available - 1))
+            self.status_label.config(text=f"Chargement: {loaded}/{total} images ({loaded / elapsed:.0f} img/s)")
+            self.master.after(100, self.poll_progressive_load)
+        else:
+            self.is_loading = False
+            self.timeline_slider.config(to=max(0, len(self.timeline) - 1))
+            self.status_label.config(text=f"{self.load_status_text} (chargé en {elapsed:.1f}s, {total / elapsed:.0f} img/s)")
+            self.start_motion_analysis()
+
     def get_clipboard_file_path(self):
         try:
+            import win32clipboard, win32con
             win32clipboard.OpenClipboard()
             if win32clipboard.IsClipboardFormatAvailable(win32con.CF_HDROP): return win32clipboard.GetClipboardData(win32con.CF_HDROP)[0]
             win32clipboard.CloseClipboard()
         except Exception: return None
 
     def on_slider_move(self, value):
+        previous_index = self.current_frame_index
         self.current_frame_index = int(value)
-        self.display_current_frame()
-        duration_secs = self.current_frame_index / FPS
+        duration_secs = self.timeline.time_at(self.current_frame_index)
         self.timeline_label.config(text=f"{duration_secs:.1f}s")
+        self.prefetch_frames(1 if self.current_frame_index >= previous_index else -1)
+        self.schedule_scrub_render()
+
+    def schedule_scrub_render(self):
+        # Slider events are coalesced: only the latest position gets rendered, with a fast resampler
+        if self.render_after_id is None:
+            self.render_after_id = self.master.after_idle(self.render_scrub_frame)
+        if self.settle_after_id:
+            self.master.after_cancel(self.settle_after_id)
+        self.settle_after_id = self.master.after(SCRUB_SETTLE_MS, self.render_settled_frame)
+
+    def render_scrub_frame(self):
+        self.render_after_id = None
+        self.display_current_frame(high_quality=False)
+
+    def render_settled_frame(self):
+        self.settle_after_id = None
+        self.display_current_frame()
 
-    def display_current_frame(self):
-        if not self.gif_frames: self.display_blank_canvas(); return
-        frame_data = self.gif_frames[self.current_frame_index]
-        pil_image = Image.fromarray(frame_data).convert("RGBA")
+    def invalidate_display_cache(self):
+        self.display_cache.clear()
 
-        # Pre-render committed annotations
-        pil_image = self.draw_annotations_on_image(pil_image, self.current_frame_index)
+    def prefetch_frames(self, direction):
+        if not self.frame_store: return
+        self.timeline.prefetch(range(self.current_frame_index + direction, self.current_frame_index + direction * (PREFETCH_COUNT + 1), direction))
 
-        img_width, img_height = pil_image.size
+    def display_current_frame(self, high_quality=True):
+        if not self.timeline: self.display_blank_canvas(); return
         self.canvas.update_idletasks()
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
 
-        if img_width == 0 or img_height == 0: self.display_blank_canvas(); return
-
-        self.zoom_ratio = min(canvas_width / img_width, canvas_height / img_height)
-        display_width = int(img_width * self.zoom_ratio)
-        display_height = int(img_height * self.zoom_ratio)
+        hq_key, fast_key = (self.current_frame_index, canvas_width, canvas_height, True), (self.current_frame_index, canvas_width, canvas_height, False)
+        cache_key = hq_key if high_quality or hq_key in self.display_cache else fast_key
+        cached = self.display_cache.get(cache_key)
+        if cached is None:
+            # Committed annotations are composited from their pre-rasterized sprites
+            frame_data = self.annotation_index.annotate(self.timeline.frame(self.current_frame_index), self.current_frame_index)
+            pil_image = Image.fromarray(frame_data)
 
-        self.display_image = pil_image.resize((display_width, display_height), Image.LANCZOS)
-        self.photo_image = ImageTk.PhotoImage(self.display_image)
+            img_width, img_height = pil_image.size
+            if img_width == 0 or img_height == 0: self.display_blank_canvas(); return
+
+            zoom_ratio = min(canvas_width / img_width, canvas_height / img_height)
+            display_size = (max(1, int(img_width * zoom_ratio)), max(1, int(img_height * zoom_ratio)))
+            resample = Image.LANCZOS if cache_key[-1] else Image.BILINEAR
+            cached = (ImageTk.PhotoImage(pil_image.resize(display_size, resample)), zoom_ratio, display_size)
+            self.display_cache[cache_key] = cached
+            if len(self.display_cache) > DISPLAY_CACHE_SIZE:
+                self.display_cache.popitem(last=False)
+        else:
+            self.display_cache.move_to_end(cache_key)
+        self.photo_image, self.zoom_ratio, (display_width, display_height) = cached
         
         self.x_offset = (canvas_width - display_width) / 2
         self.y_offset = (canvas_height - display_height) / 2
 
-        self.canvas.delete("all")
-        self.canvas.create_image(self.x_offset, self.y_offset, anchor=tk.NW, image=self.photo_image)
+        # The base frame is one persistent canvas item, live overlays are kept above it
+        if self.frame_image_id is None:
+            self.frame_image_id = self.canvas.create_image(self.x_offset, self.y_offset, anchor=tk.NW, image=self.photo_image)
+            self.canvas.tag_lower(self.frame_image_id)
+        else:
+            self.canvas.coords(self.frame_image_id, self.x_offset, self.y_offset)
+            self.canvas.itemconfig(self.frame_image_id, image=self.photo_image)
+        self.canvas.delete("live_stroke") # Committed strokes are now part of the frame
         self.canvas.config(scrollregion=(0, 0, canvas_width, canvas_height))
+        if self.requested_at:
+            print(f"DEBUG: Première image affichée {(time.time() - self.requested_at) * 1000:.0f} ms après la demande")
+            self.requested_at = None
+        gif_startup.mark("first frame"); gif_startup.report("gif_editor")
         
         self.h_scrollbar.pack_forget()
         self.v_scrollbar.pack_forget()
 
-        self.draw_live_text()
+        self.update_live_text()
 
-    def draw_live_text(self):
-        if self.is_editing_text:
-            ix, iy = self.current_text_position
-            cx, cy = self.image_to_canvas_coords(ix, iy)
-            scaled_font_size = max(1, int(self.current_text_font_size * self.zoom_ratio))
-            cursor = "|" if int(time.time() * 1.5) % 2 == 0 else ""
-            self.canvas.create_text(cx, cy, text=self.current_text_string + cursor, fill=self.pencil_color, font=('Candara', scaled_font_size), anchor=tk.SW)
-
-    def display_blank_canvas(self): self.canvas.delete("all"); self.canvas.config(bg=BLANK_CANVAS_COLOR)
+    def update_live_text(self):
+        # Only the text item changes while typing, the base frame is left alone
+        if not self.is_editing_text:
+            if self.live_text_id is not None:
+                self.canvas.delete(self.live_text_id)
+                self.live_text_id = None
+            return
+        ix, iy = self.current_text_position
+        cx, cy = self.image_to_canvas_coords(ix, iy)
+        scaled_font_size = max(1, int(self.current_text_font_size * self.zoom_ratio))
+        cursor = "|" if int(time.time() * 1.5) % 2 == 0 else ""
+        if self.live_text_id is None:
+            self.live_text_id = self.canvas.create_text(cx, cy, anchor=tk.SW)
+        self.canvas.coords(self.live_text_id, cx, cy)
+        self.canvas.itemconfig(self.live_text_id, text=self.current_text_string + cursor, fill=self.pencil_color, font=('Candara', scaled_font_size))
+
+    def display_blank_canvas(self):
+        self.canvas.delete("all"); self.canvas.config(bg=BLANK_CANVAS_COLOR)
+        self.frame_image_id, self.live_text_id, self.crop_rect_id = None, None, None
+        gif_startup.mark("blank canvas"); gif_startup.report("gif_editor")
     
     def handle_escape(self, event=None):
         if self.is_editing_text:
@@ -387,17 +593,15 @@ class GifEditorApp:
             self.canvas.coords(self.crop_rect_id, self.crop_start_x, self.crop_start_y, cur_x, cur_y)
         elif self.current_tool == 'pencil' and self.last_x is not None:
             x_canvas, y_canvas = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-            self.canvas.create_line(self.last_x, self.last_y, x_canvas, y_canvas, fill=self.pencil_color, width=2, capstyle=tk.ROUND)
+            self.canvas.create_line(self.last_x, self.last_y, x_canvas, y_canvas, fill=self.pencil_color, width=2, capstyle=tk.ROUND, tags="live_stroke")
             self.current_drawing_segments.append((self.last_x, self.last_y, x_canvas, y_canvas))
             self.last_x, self.last_y = x_canvas, y_canvas
 
     def on_canvas_release(self, event):
         if self.current_tool == 'crop':
-            if not self.gif_frames: return
+            if not self.timeline: return
             
-            frame_data = self.gif_frames[self.current_frame_index]
-            pil_image = Image.fromarray(frame_data)
-            img_width, img_height = pil_image.size
+            img_height, img_width = self.timeline.frame(self.current_frame_index).shape[:2]
 
             cx1_raw = self.crop_start_x
             cy1_raw = self.crop_start_y
@@ -429,12 +633,10 @@ class GifEditorApp:
                     ix2, iy2 = self.canvas_to_image_coords(cx2, cy2)
                     image_segments.append((ix1, iy1, ix2, iy2))
                 
-                self.edit_events.append({'type': 'pencil', 'segments': image_segments, 'start_frame': self.current_frame_index, 'end_frame': self.current_frame_index + int(FPS * 1), 'color': self.pencil_color, 'width': 5})
-                self.redo_stack.clear()
-                self.marker_positions.append(self.current_frame_index)
-                self.redo_marker_positions.clear()
-                self.update_undo_redo_state()
-                self.update_timeline_markers()
+                pencil_event = {'type': 'pencil', 'segments': image_segments, 'start_frame': self.current_frame_index, 'end_frame': self.timeline.index_after(self.current_frame_index, ANNOTATION_DURATION_MS), 'color': self.pencil_color, 'width': 5}
+                self.push_action(('annotation', pencil_event))
+            else:
+                self.canvas.delete("live_stroke")
             self.current_drawing_segments = None
 
     def enter_crop_mode(self):
@@ -451,34 +653,63 @@ class GifEditorApp:
             self.crop_rect_id = None
         self.confirm_crop_button.pack_forget()
         self.cancel_crop_button.pack_forget()
-        self.status_label.config(text=f"{os.path.basename(self.original_gif_path)} - {len(self.gif_frames)} images")
+        self.status_label.config(text=f"{os.path.basename(self.original_gif_path)} - {len(self.timeline)} images")
 
     def confirm_crop(self):
         if not self.crop_coords: return
         x1, y1, x2, y2 = self.crop_coords
         if x1 >= x2 or y1 >= y2: self.exit_crop_mode(); return
 
-        new_frames = []
-        for frame_data in self.gif_frames:
-            new_frames.append(frame_data[y1:y2, x1:x2])
-        self.gif_frames = new_frames
+        # Crop is virtual: frames stay untouched in the store and are sliced on access
+        self.exit_crop_mode()
+        crop_op = self.timeline.crop_relative(x1, y1, x2, y2)
+        self.shift_annotations(-x1, -y1)
+        self.push_action(('crop', crop_op, x1, y1), apply=False)
+        self.status_label.config(text=f"Crop appliqué. Nouvelle taille: {x2-x1}x{y2-y1}")
+
+    def auto_crop(self, segment_only=False):
+        """Crops to the pixels that change, over the whole clip or over the segment (run between
+        two scene cuts) holding the current frame. Applied like a hand-drawn crop, so it undoes the same way."""
+        if not self.timeline: return
+        self.finalize_text_entry()
+        if self.current_tool == 'crop': self.exit_crop_mode()
+        current_index = self.current_frame_index
+        height, width = self.timeline.frame(current_index).shape[:2]
+
+        def analyse(job):
+            job.stage = "Analyse de l'activité"
+            return activity_segments(self.timeline, job)
+
+        def on_done(segments):
+            if segment_only:
+                segment = next(seg for seg in segments if seg.start <= current_index < seg.stop)
+                box = segment.box
+            else:
+                box = union_box(seg.box for seg in segments)
+            if not box:
+                self.status_label.config(text="Aucune activité détectée: crop inchangé.")
+                return
+            x1, y1, x2, y2 = pad_box(box, width, height)
+            if (x1, y1, x2, y2) == (0, 0, width, height):
+                self.status_label.config(text="L'activité couvre toute l'image: crop inchangé.")
+                return
+            crop_op = self.timeline.crop_relative(x1, y1, x2, y2)
+            self.shift_annotations(-x1, -y1)
+            self.push_action(('crop', crop_op, x1, y1), apply=False)
+            self.status_label.config(text=f"Auto-crop appliqué. Nouvelle taille: {x2-x1}x{y2-y1}")
 
+        self._run_export_job("Auto-crop", analyse, on_done, cancelled_message="Auto-crop annulé.")
+
+    def shift_annotations(self, dx, dy):
         for event in self.edit_events:
             if event.get('type', 'pencil') == 'pencil':
-                new_segments = []
-                for seg_x1, seg_y1, seg_x2, seg_y2 in event['segments']:
-                    new_segments.append((seg_x1 - x1, seg_y1 - y1, seg_x2 - x1, seg_y2 - y1))
-                event['segments'] = new_segments
+                event['segments'] = [(seg_x1 + dx, seg_y1 + dy, seg_x2 + dx, seg_y2 + dy) for seg_x1, seg_y1, seg_x2, seg_y2 in event['segments']]
             elif event.get('type') == 'text':
-                event['pos'] = (event['pos'][0] - x1, event['pos'][1] - y1)
-
-        self.exit_crop_mode()
-        self.display_current_frame()
-        self.update_timeline_markers()
-        self.status_label.config(text=f"Crop appliqué. Nouvelle taille: {x2-x1}x{y2-y1}")
+                event['pos'] = (event['pos'][0] + dx, event['pos'][1] + dy)
+        self.annotation_index.invalidate()
 
     def start_text_entry(self, event):
-        if not self.gif_frames: return
+        if not self.timeline: return
         self.finalize_text_entry() # Finalize any previous entry
         
         self.is_editing_text = True
@@ -488,34 +719,35 @@ class GifEditorApp:
         self.current_text_string = ""
         
         self.canvas.focus_set()
-        self.display_current_frame() # To draw the cursor
+        self.update_live_text() # To draw the cursor
 
     def cancel_text_entry(self):
         if not self.is_editing_text: return
         self.is_editing_text = False
         self.current_text_string = ""
-        self.display_current_frame()
+        self.update_live_text()
 
     def finalize_text_entry(self):
         if not self.is_editing_text: return
 
-        if self.current_text_string:
+        text_committed = bool(self.current_text_string)
+        if text_committed:
             text_event = {
                 'type': 'text',
                 'start_frame': self.current_frame_index,
-                'end_frame': self.current_frame_index + int(FPS),
+                'end_frame': self.timeline.index_after(self.current_frame_index, ANNOTATION_DURATION_MS),
                 'text': self.current_text_string,
                 'font_size': self.current_text_font_size,
                 'color': self.pencil_color,
                 'pos': self.current_text_position
             }
-            self.edit_events.append(text_event)
-            self.redo_stack.clear()
-            self.update_undo_redo_state()
         
         self.is_editing_text = False
         self.current_text_string = ""
-        self.display_current_frame()
+        if text_committed:
+            self.push_action(('annotation', text_event))
+        else:
+            self.update_live_text()
 
     def handle_text_keypress(self, event):
         if not self.is_editing_text: return
@@ -529,7 +761,7 @@ class GifEditorApp:
         elif event.char and event.char.isprintable():
             self.current_text_string += event.char
         
-        self.display_current_frame()
+        self.update_live_text()
 
     def activate_pencil_tool(self):
         self.finalize_text_entry()
@@ -542,23 +774,60 @@ class GifEditorApp:
         self.master.config(cursor="crosshair")
         self.status_label.config(text="Mode Texte: Cliquez pour ajouter du texte.")
 
+    def push_action(self, action, apply=True):
+        # Every edit goes through one history so annotations, timeline edits and crops undo in order
+        if apply: self.apply_action(action)
+        self.undo_stack.append(action)
+        self.redo_stack.clear()
+        self.refresh_after_edit()
+
+    def apply_action(self, action):
+        kind = action[0]
+        if kind == 'annotation':
+            self.edit_events.append(action[1])
+            self.annotation_index.add(action[1])
+        elif kind == 'timeline':
+            self.timeline.apply(action[1])
+        elif kind == 'crop':
+            _, op, x1, y1 = action
+            self.timeline.apply(op)
+            self.shift_annotations(-x1, -y1)
+
+    def revert_action(self, action):
+        kind = action[0]
+        if kind == 'annotation':
+            self.edit_events.pop()
+            self.annotation_index.remove(action[1])
+        elif kind == 'timeline':
+            self.timeline.revert(action[1])
+        elif kind == 'crop':
+            _, op, x1, y1 = action
+            self.timeline.revert(op)
+            self.shift_annotations(x1, y1)
+
     def undo(self, event=None):
-        if self.edit_events: 
-            self.redo_stack.append(self.edit_events.pop())
-            if self.marker_positions:
-                self.redo_marker_positions.append(self.marker_positions.pop())
-            self.display_current_frame()
-            self.update_undo_redo_state()
-            self.update_timeline_markers()
+        if self.undo_stack: 
+            action = self.undo_stack.pop()
+            self.revert_action(action)
+            self.redo_stack.append(action)
+            self.refresh_after_edit()
 
     def redo(self, event=None):
         if self.redo_stack: 
-            self.edit_events.append(self.redo_stack.pop())
-            if self.redo_marker_positions:
-                self.marker_positions.append(self.redo_marker_positions.pop())
-            self.display_current_frame()
-            self.update_undo_redo_state()
-            self.update_timeline_markers()
+            action = self.redo_stack.pop()
+            self.apply_action(action)
+            self.undo_stack.append(action)
+            self.refresh_after_edit()
+
+    def refresh_after_edit(self):
+        if self.current_frame_index >= len(self.timeline): self.current_frame_index = max(0, len(self.timeline) - 1)
+        self.timeline_slider.config(to=max(0, len(self.timeline) - 1))
+        self.timeline_slider.set(self.current_frame_index)
+        self.invalidate_display_cache()
+        self.display_current_frame()
+        self.update_undo_redo_state()
+        self.update_timeline_markers()
+        self.schedule_session_save()
 
     def update_timeline_markers(self):
         if not self.marker_canvas: return
@@ -566,84 +835,224 @@ class GifEditorApp:
         self.marker_canvas.update_idletasks()
         
         canvas_width = self.marker_canvas.winfo_width()
-        num_frames = len(self.gif_frames)
+        num_frames = len(self.timeline)
         if num_frames < 2 or canvas_width == 1: return
 
-        for frame_index in self.marker_positions:
-            x_pos = (frame_index / (num_frames - 1)) * canvas_width
+        energy = self.timeline_energy()
+        if energy:
+            # Square root keeps small changes (cursor, typing) visible next to full-screen ones
+            peak = max(energy) ** 0.5 or 1
+            points = [0, MARKER_CANVAS_HEIGHT]
+            for i, value in enumerate(energy):
+                x_pos = (i / (num_frames - 1)) * canvas_width
+                points += [x_pos, MARKER_CANVAS_HEIGHT - (value ** 0.5 / peak) * (MARKER_CANVAS_HEIGHT - 6)]
+            points += [canvas_width, MARKER_CANVAS_HEIGHT]
+            self.marker_canvas.create_polygon(points, fill=ENERGY_COLOR, outline="")
+
+        for event in self.edit_events:
+            if event.get('type', 'pencil') != 'pencil': continue
+            x_pos = (event['start_frame'] / (num_frames - 1)) * canvas_width
             self.marker_canvas.create_line(x_pos, 0, x_pos, 5, fill=ANNOTATION_COLOR, width=1)
 
+    def timeline_energy(self):
+        """Motion energy of each timeline entry from the cache, or None until all of them have been measured."""
+        entries = self.timeline.entries
+        pairs = [(None if i == 0 else entries[i - 1].source, entry.source) for i, entry in enumerate(entries)]
+        if not pairs or any(pair not in self.motion_energy for pair in pairs[1:]): return None
+        return [0.0] + [self.motion_energy[pair] for pair in pairs[1:]]
+
+    def on_marker_click(self, event):
+        if not self.timeline or self.is_loading: return
+        canvas_width = self.marker_canvas.winfo_width()
+        if len(self.timeline) < 2 or canvas_width <= 1: return
+        index = round(min(max(event.x / canvas_width, 0), 1) * (len(self.timeline) - 1))
+        self.timeline_slider.set(index)
+        self.on_slider_move(index)
+
     def update_undo_redo_state(self):
-        self.undo_button.config(state=tk.NORMAL if self.edit_events else tk.DISABLED)
+        self.undo_button.config(state=tk.NORMAL if self.undo_stack else tk.DISABLED)
         self.redo_button.config(state=tk.NORMAL if self.redo_stack else tk.DISABLED)
 
     def delete_first_frames(self):
-        if not self.gif_frames: return
+        if not self.timeline: return
         num_to_delete = NUM_FRAMES_TO_CUT
-        if len(self.gif_frames) <= num_to_delete: self.gif_frames = []
-        else: self.gif_frames = self.gif_frames[num_to_delete:]
         self.current_frame_index = max(0, self.current_frame_index - num_to_delete)
-        if not self.gif_frames: self.timeline_slider.config(to=0); self.current_frame_index = 0
-        else: self.timeline_slider.config(to=len(self.gif_frames) - 1)
-        self.timeline_slider.set(self.current_frame_index)
-        self.display_current_frame()
-        self.status_label.config(text=f"Supprimé {num_to_delete} premières images. Reste {len(self.gif_frames)} images.")
+        self.push_action(('timeline', self.timeline.splice(0, num_to_delete, [])), apply=False)
+        self.status_label.config(text=f"Supprimé {num_to_delete} premières images. Reste {len(self.timeline)} images.")
 
     def delete_last_frames(self):
-        if not self.gif_frames: return
+        if not self.timeline: return
         num_to_delete = NUM_FRAMES_TO_CUT
-        if len(self.gif_frames) <= num_to_delete: self.gif_frames = []
-        else: self.gif_frames = self.gif_frames[:-num_to_delete]
-        self.current_frame_index = min(self.current_frame_index, len(self.gif_frames) - 1)
-        if not self.gif_frames: self.timeline_slider.config(to=0); self.current_frame_index = 0
-        else: self.timeline_slider.config(to=len(self.gif_frames) - 1)
-        self.timeline_slider.set(self.current_frame_index)
-        self.display_current_frame()
-        self.status_label.config(text=f"Supprimé {num_to_delete} dernières images. Reste {len(self.gif_frames)} images.")
+        self.push_action(('timeline', self.timeline.splice(max(0, len(self.timeline) - num_to_delete), len(self.timeline), [])), apply=False)
+        self.status_label.config(text=f"Supprimé {num_to_delete} dernières images. Reste {len(self.timeline)} images.")
+
+    def start_motion_analysis(self):
+        """Measures the motion curve in the background once the whole clip is in the frame cache."""
+        if self.timeline_energy() is not None: return
+        entries, frames = list(self.timeline.entries), self.timeline.iter_frames()
+        job = ExportJob(lambda job: list(motion_energy(frames, job)), total=len(entries), stage="Analyse du mouvement").start()
+        self.motion_job = job
+        def poll():
+            if not job.finished.is_set():
+                self.master.after(200, poll)
+                return
+            if job.error is None and not job.cancel_event.is_set(): self.store_motion_energy(entries, job.result)
+        poll()
+
+    def analyze_motion(self, then=None):
+        """Measures the motion curve of the whole timeline, without changing it, and draws it under the markers."""
+        if not self.timeline or self.is_loading: return
+        entries = list(self.timeline.entries)
+
+        def measure(job):
+            job.stage = "Analyse du mouvement"
+            return list(motion_energy(self.timeline.iter_frames(), job))
+
+        def on_done(energy):
+            self.store_motion_energy(entries, energy)
+            if then: then()
+            else: self.status_label.config(text="Courbe de mouvement sous la timeline: cliquez pour aller à une image.")
+
+        self._run_export_job("Analyse du mouvement", measure, on_done, cancelled_message="Analyse annulée.")
+
+    def store_motion_energy(self, entries, energy):
+        for previous, entry, value in zip(entries, entries[1:], energy[1:]):
+            self.motion_energy[(previous.source, entry.source)] = value
+        self.update_timeline_markers()
+
+    def auto_trim(self):
+        """Cuts the idle lead-in and tail found by the motion energy curve, keeping AUTO_TRIM_MARGIN_MS around the action."""
+        if not self.timeline or self.is_loading: return
+        energy = self.timeline_energy()
+        if energy is None:
+            self.analyze_motion(then=self.auto_trim) # Measured first, then trimmed
+            return
+        entries = list(self.timeline.entries)
+        span = active_span(energy, [entry.duration for entry in entries])
+        if span is None:
+            self.status_label.config(text="Aucun mouvement détecté: rien n'a été coupé.")
+            return
+        start, stop = span
+        if (start, stop) == (0, len(entries)):
+            self.status_label.config(text="Pas de temps mort à couper.")
+            return
+        # One splice keeps both cuts in a single undo step
+        self.current_frame_index = min(max(0, self.current_frame_index - start), stop - start - 1)
+        self.push_action(('timeline', self.timeline.splice(0, len(entries), entries[start:stop])), apply=False)
+        self.status_label.config(text=f"Auto-trim: {start} images coupées au début, {len(entries) - stop} à la fin. Reste {len(self.timeline)} images.")
 
     def delete_current_frame(self):
-        if not self.gif_frames or not (0 <= self.current_frame_index < len(self.gif_frames)): return
-        self.gif_frames.pop(self.current_frame_index)
-        if not self.gif_frames: self.current_frame_index = 0; self.timeline_slider.config(to=0)
-        else:
-            if self.current_frame_index >= len(self.gif_frames): self.current_frame_index = len(self.gif_frames) - 1
-            self.timeline_slider.config(to=len(self.gif_frames) - 1)
-        self.timeline_slider.set(self.current_frame_index)
-        self.display_current_frame()
-        self.status_label.config(text=f"Image supprimée. Reste {len(self.gif_frames)} images.")
+        if not self.timeline or not (0 <= self.current_frame_index < len(self.timeline)): return
+        self.push_action(('timeline', self.timeline.splice(self.current_frame_index, self.current_frame_index + 1, [])), apply=False)
+        self.status_label.config(text=f"Image supprimée. Reste {len(self.timeline)} images.")
 
     def duplicate_current_frame(self):
-        if not self.gif_frames or not (0 <= self.current_frame_index < len(self.gif_frames)): return
-        frame_to_duplicate = self.gif_frames[self.current_frame_index]
-        self.gif_frames.insert(self.current_frame_index + 1, frame_to_duplicate)
-        self.timeline_slider.config(to=len(self.gif_frames) - 1)
-        self.current_frame_index += 1
-        self.timeline_slider.set(self.current_frame_index)
-        self.display_current_frame()
-        self.status_label.config(text=f"Image dupliquée. Total {len(self.gif_frames)} images.")
+        if not self.timeline or not (0 <= self.current_frame_index < len(self.timeline)): return
+        # A hold lengthens the frame's display time instead of cloning it
+        entry = self.timeline.entries[self.current_frame_index]
+        self.push_action(('timeline', self.timeline.set_durations(self.current_frame_index, [entry.duration + FRAME_DURATION_MS])), apply=False)
+        self.status_label.config(text=f"Image maintenue {(entry.duration + FRAME_DURATION_MS) / 1000:.2f}s. Durée totale {self.timeline.time_at(len(self.timeline)):.1f}s.")
 
     def apply_slowmo_effect(self):
-        if not self.gif_frames: return
+        if not self.timeline: return
         C = self.current_frame_index
-        num_frames = len(self.gif_frames)
-        pyramid = [(-5, 1), (-4, 2), (-3, 3), (-2, 4), (-1, 5), (0, 10), (1, 5), (2, 4), (3, 3), (4, 2), (5, 1)]
-        start_effect_idx, end_effect_idx = C - 5, C + 5
-        new_frames = []
-        new_frames.extend(self.gif_frames[:max(0, start_effect_idx)])
-        for i in range(start_effect_idx, end_effect_idx + 1):
-            if 0 <= i < num_frames:
-                original_frame = self.gif_frames[i]
-                new_frames.append(original_frame)
-                repetitions = 0
-                offset = i - C
-                for p_offset, p_reps in pyramid:
-                    if p_offset == offset: repetitions = p_reps; break
-                for _ in range(repetitions): new_frames.append(original_frame)
-        new_frames.extend(self.gif_frames[end_effect_idx + 1:])
-        self.gif_frames = new_frames
-        self.timeline_slider.config(to=len(self.gif_frames) - 1)
-        self.display_current_frame()
-        self.status_label.config(text=f"Effet SlowMo appliqué. Total {len(self.gif_frames)} images.")
+        num_frames = len(self.timeline)
+        pyramid = {-5: 1, -4: 2, -3: 3, -2: 4, -1: 5, 0: 10, 1: 5, 2: 4, 3: 3, 4: 2, 5: 1}
+        start_effect_idx, end_effect_idx = max(0, C - 5), min(num_frames, C + 6)
+        # Frames are slowed down by lengthening their display time, nothing is repeated
+        durations = [self.timeline.entries[i].duration * (1 + pyramid[i - C]) for i in range(start_effect_idx, end_effect_idx)]
+        self.push_action(('timeline', self.timeline.set_durations(start_effect_idx, durations)), apply=False)
+        self.status_label.config(text=f"Effet SlowMo appliqué. Durée totale {self.timeline.time_at(len(self.timeline)):.1f}s.")
+
+    def apply_speed_ramp(self, start_percent, end_percent, num_frames):
+        if not self.timeline: return
+        num_frames = max(1, min(num_frames, len(self.timeline) - self.current_frame_index))
+        durations = []
+        for i in range(num_frames):
+            speed = start_percent + (end_percent - start_percent) * (i / (num_frames - 1) if num_frames > 1 else 0)
+            durations.append(self.timeline.entries[self.current_frame_index + i].duration * 100 / max(1, speed))
+        self.push_action(('timeline', self.timeline.set_durations(self.current_frame_index, durations)), apply=False)
+        self.status_label.config(text=f"Rampe de vitesse {start_percent}% → {end_percent}% sur {num_frames} images. Durée totale {self.timeline.time_at(len(self.timeline)):.1f}s.")
+
+    def choose_speed_ramp(self):
+        ramp_dialog = tk.Toplevel(self.master)
+        ramp_dialog.title("Rampe de vitesse")
+        ramp_dialog.config(bg="#2E2E2E")
+        set_dark_title_bar(ramp_dialog)
+        ramp_dialog.transient(self.master)
+        ramp_dialog.grab_set()
+
+        spinboxes = {}
+        for row, (key, label, low, high, default) in enumerate([
+                ('start', "Vitesse de départ (%):", 10, 400, 100),
+                ('end', "Vitesse de fin (%):", 10, 400, 25),
+                ('frames', "Nombre d'images:", 1, 9999, 20)]):
+            tk.Label(ramp_dialog, text=label, bg="#2E2E2E", fg="white").grid(row=row, column=0, padx=10, pady=5, sticky="w")
+            spinbox = tk.Spinbox(ramp_dialog, from_=low, to=high, width=6)
+            spinbox.grid(row=row, column=1, padx=10, pady=5)
+            spinbox.delete(0, "end")
+            spinbox.insert(0, str(default))
+            spinboxes[key] = spinbox
+
+        def on_ok():
+            values = {key: spinbox.get() for key, spinbox in spinboxes.items()}
+            ramp_dialog.destroy()
+            if all(value.isdigit() for value in values.values()):
+                self.apply_speed_ramp(int(values['start']), int(values['end']), int(values['frames']))
+
+        tk.Button(ramp_dialog, text="OK", command=on_ok, fg="white", bg="#28a745", relief=tk.FLAT).grid(row=3, column=0, columnspan=2, pady=10)
+        ramp_dialog.bind("<Return>", lambda e: on_ok())
+        ramp_dialog.bind("<Escape>", lambda e: ramp_dialog.destroy())
+
+    def choose_webm_settings(self):
+        settings_dialog = tk.Toplevel(self.master)
+        settings_dialog.title("Réglages WebM")
+        settings_dialog.config(bg="#2E2E2E")
+        set_dark_title_bar(settings_dialog)
+        settings_dialog.transient(self.master)
+        settings_dialog.grab_set()
+
+        current = self.webm_settings
+        even_modes = {'crop': "Rogner 1 pixel", 'pad': "Compléter 1 pixel"}
+        codec_var = tk.StringVar(value=current.codec)
+        deadline_var = tk.StringVar(value=current.deadline)
+        even_var = tk.StringVar(value=even_modes[current.even_mode])
+        row_mt_var = tk.BooleanVar(value=current.row_mt)
+
+        def add_row(row, label, widget):
+            tk.Label(settings_dialog, text=label, bg="#2E2E2E", fg="white").grid(row=row, column=0, padx=10, pady=5, sticky="w")
+            widget.grid(row=row, column=1, padx=10, pady=5, sticky="ew")
+
+        def make_spinbox(low, high, value):
+            spinbox = tk.Spinbox(settings_dialog, from_=low, to=high, width=6)
+            spinbox.delete(0, "end")
+            spinbox.insert(0, str(value))
+            return spinbox
+
+        crf_spinbox = make_spinbox(4, 63, current.crf)
+        cpu_spinbox = make_spinbox(0, 8, current.cpu_used)
+        threads_spinbox = make_spinbox(1, 64, current.threads)
+        add_row(0, "Codec:", tk.OptionMenu(settings_dialog, codec_var, *WEBM_CODECS))
+        add_row(1, "Qualité CRF (bas = meilleur):", crf_spinbox)
+        add_row(2, "Vitesse -cpu-used (haut = rapide):", cpu_spinbox)
+        add_row(3, "Deadline:", tk.OptionMenu(settings_dialog, deadline_var, *WEBM_DEADLINES))
+        add_row(4, "Threads:", threads_spinbox)
+        add_row(5, "Dimensions paires:", tk.OptionMenu(settings_dialog, even_var, *even_modes.values()))
+        tk.Checkbutton(settings_dialog, text="Multithread par lignes (VP9)", variable=row_mt_var, bg="#2E2E2E", fg="white", selectcolor="#2E2E2E", activebackground="#2E2E2E").grid(row=6, column=0, columnspan=2, padx=10, sticky="w")
+
+        def on_ok():
+            values = [crf_spinbox.get(), cpu_spinbox.get(), threads_spinbox.get()]
+            if not all(value.isdigit() for value in values):
+                messagebox.showerror("Erreur", "Veuillez entrer des nombres entiers.", parent=settings_dialog)
+                return
+            crf, cpu_used, threads = (int(value) for value in values)
+            even_mode = next(mode for mode, label in even_modes.items() if label == even_var.get())
+            self.webm_settings = WebmSettings(codec_var.get(), min(max(crf, 4), 63), min(max(cpu_used, 0), 8), deadline_var.get(), max(threads, 1), row_mt_var.get(), even_mode)
+            settings_dialog.destroy()
+
+        tk.Button(settings_dialog, text="OK", command=on_ok, fg="white", bg="#28a745", relief=tk.FLAT).grid(row=7, column=0, columnspan=2, pady=10)
+        settings_dialog.bind("<Return>", lambda e: on_ok())
+        settings_dialog.bind("<Escape>", lambda e: settings_dialog.destroy())
 
     def choose_pencil_color(self):
         color_win = tk.Toplevel(self.master); color_win.title("Couleurs"); color_win.config(bg="#2E2E2E"); set_dark_title_bar(color_win); color_win.transient(self.master); color_win.grab_set()
@@ -661,27 +1070,6 @@ class GifEditorApp:
         luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255
         return "white" if luminance < 0.5 else "black"
 
-    def draw_annotations_on_image(self, image, frame_index):
-        fonts = {} # Cache fonts for performance
-        draw = ImageDraw.Draw(image)
-
-        for event in self.edit_events:
-            event_type = event.get('type', 'pencil')
-            if event.get('start_frame', 0) <= frame_index < event.get('end_frame', 0):
-                if event_type == 'pencil':
-                    for seg_x1, seg_y1, seg_x2, seg_y2 in event['segments']:
-                        draw.line((seg_x1, seg_y1, seg_x2, seg_y2), fill=event['color'], width=event['width'])
-                elif event_type == 'text':
-                    font_size = event['font_size']
-                    if font_size not in fonts:
-                        try: fonts[font_size] = ImageFont.truetype("candara.ttf", font_size)
-                        except IOError:
-                            try: fonts[font_size] = ImageFont.truetype("arial.ttf", font_size)
-                            except IOError: fonts[font_size] = ImageFont.load_default()
-                    
-                    draw.text(event['pos'], event['text'], fill=event['color'], font=fonts[font_size], anchor="ls")
-        return image
-
     def choose_font_size(self):
         size_dialog = tk.Toplevel(self.master)
         size_dialog.title("Taille Police")
@@ -710,8 +1098,9 @@ class GifEditorApp:
         size_dialog.bind("<Return>", lambda e: on_ok())
         size_dialog.bind("<Escape>", lambda e: size_dialog.destroy())
 
-    def _prepare_frames_for_export(self, title="Export en cours..."):
-        if not self.gif_frames or not self.original_gif_path: return None, None
+    def _run_export_job(self, title, work, on_success, on_failure=None, cancelled_message="Export annulé."):
+        """Runs work(job) on a background thread behind a cancellable progress window."""
+        if not self.timeline or not self.original_gif_path: return None
 
         progress_win = tk.Toplevel(self.master)
         progress_win.geometry("+5000+5000") # Move off-screen during setup
@@ -723,7 +1112,7 @@ class GifEditorApp:
         progress_win.grab_set()
         
         # Center window
-        width, height = 300, 100
+        width, height = 300, 130
         x, y = self.master.winfo_x() + (self.master.winfo_width() // 2) - (width // 2), self.master.winfo_y() + (self.master.winfo_height() // 2) - (height // 2)
         progress_win.geometry(f"{width}x{height}+{x}+{y}")
         progress_win.deiconify()
@@ -731,196 +1120,267 @@ class GifEditorApp:
         progress_label = tk.Label(progress_win, text="Préparation des images...", bg="#2E2E2E", fg="white", padx=20, pady=10)
         progress_label.pack()
         progress_bar = ttk.Progressbar(progress_win, orient=tk.HORIZONTAL, length=260, mode='determinate')
-        progress_bar.pack(padx=20, pady=(0, 20))
-        progress_win.update_idletasks()
-        
-        try:
-            pil_frames = [Image.fromarray(frame).convert("RGBA") for frame in self.gif_frames]
-            
-            progress_bar['maximum'] = len(pil_frames)
-            for i, pil_frame in enumerate(pil_frames):
-                pil_frames[i] = self.draw_annotations_on_image(pil_frame, i)
-                
-                progress_bar['value'] = i + 1
-                progress_label.config(text=f"Préparation: {i+1}/{len(pil_frames)}")
-                progress_win.update_idletasks()
-
-            final_frames = []
-            for frame in pil_frames:
-                if frame.mode == 'RGBA':
-                    rgb_frame = Image.new("RGB", frame.size, (255, 255, 255)); rgb_frame.paste(frame, (0, 0), frame)
-                    final_frames.append(np.array(rgb_frame))
-                else:
-                    final_frames.append(np.array(frame.convert("RGB")))
-
-            if not final_frames:
-                raise ValueError("Aucune image à sauvegarder.")
-                
-            return final_frames, progress_win
-
-        except Exception as e:
-            if 'progress_win' in locals() and progress_win.winfo_exists():
-                progress_win.destroy()
-            messagebox.showerror("Erreur de Préparation", f"Une erreur est survenue: {e}")
-            return None, None
+        progress_bar.pack(padx=20, pady=(0, 10))
+
+        job = ExportJob(work, total=len(self.timeline))
+        cancel_button = tk.Button(progress_win, text="Annuler", command=job.cancel, fg="white", bg="#dc3545", relief=tk.FLAT)
+        cancel_button.pack(pady=(0, 10))
+        progress_win.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        def poll():
+            if not job.finished.is_set():
+                progress_bar['maximum'] = max(1, job.total)
+                progress_bar['value'] = job.done
+                progress_label.config(text=f"{job.stage}: {job.done}/{job.total}")
+                if job.cancel_event.is_set(): cancel_button.config(state=tk.DISABLED, text="Annulation...")
+                progress_win.after(100, poll)
+                return
+            progress_win.destroy()
+            if job.error is None:
+                on_success(job.result)
+                return
+            if on_failure: on_failure()
+            if isinstance(job.error, ExportCancelled):
+                self.status_label.config(text=cancelled_message)
+            else:
+                messagebox.showerror(f"Erreur - {title}", f"Une erreur est survenue: {job.error}")
+        job.start()
+        poll()
+        return job
 
-    def export_as_gif(self):
-        final_frames, progress_win = self._prepare_frames_for_export("Export GIF en cours...")
-        if not final_frames: return
+    def _export_stream(self, job, **options):
+        return export_stream(self.timeline, self.annotation_index, job.cancel_event, **options)
 
-        try:
-            # Retrieve progress widgets from the window
-            progress_label = progress_win.winfo_children()[0]
-            progress_bar = progress_win.winfo_children()[1]
-
-            temp_dir = tempfile.gettempdir()
-            temp_original_gif_path = os.path.join(temp_dir, f"temp_original_gif_{int(time.time())}.gif")
-
-            progress_label.config(text="Sauvegarde du GIF...")
-            progress_bar['value'] = 0
-            progress_bar['maximum'] = len(final_frames)
-            progress_win.update_idletasks()
-
-            with imageio.get_writer(temp_original_gif_path, mode='I', fps=FPS, subrectangles=True) as writer:
-                for i, frame in enumerate(final_frames):
-                    writer.append_data(frame)
-                    progress_bar['value'] = i + 1
-                    progress_label.config(text=f"Sauvegarde: {i+1}/{len(final_frames)}")
-                    progress_win.update_idletasks()
-            
-            progress_win.destroy()
+    def _fold_summary(self, folded_frames, output_bytes):
+        """Frames folded away at export, and roughly what they would have cost at the output's average frame size."""
+        if not folded_frames: return ""
+        saved_kb = folded_frames * output_bytes / max(1, len(self.timeline) - folded_frames) / 1024
+        return f"{folded_frames} images identiques fusionnées (~{saved_kb:.0f} Ko économisés)"
 
-            original_size_mb = os.path.getsize(temp_original_gif_path) / (1024 * 1024)
-            estimated_compressed_size_mb = original_size_mb * 0.65
-            self._show_compression_dialog(original_size_mb, estimated_compressed_size_mb, final_frames, temp_original_gif_path)
+    def _log_gif_report(self, report):
+        print(f"DEBUG: GIF {report['frames']} images ({report['merged_frames']} fusionnées, {report.get('folded_frames', 0)} repliées), {report['bytes_per_frame'] / 1024:.1f} Ko/image")
 
-        except Exception as e:
-            if 'progress_win' in locals() and progress_win.winfo_exists():
-                progress_win.destroy()
-            messagebox.showerror("Erreur de Sauvegarde GIF", f"Une erreur est survenue: {e}")
-            if 'temp_original_gif_path' in locals() and os.path.exists(temp_original_gif_path):
-                os.remove(temp_original_gif_path)
+    def export_as_gif(self):
+        stamp = int(time.time())
+        extensions = {'gif': "gif", 'gif_small': "gif", 'webm': "webm", 'poster': "png"}
+        outputs = {name: os.path.join(tempfile.gettempdir(), f"temp_{name}_{stamp}.{extensions[name]}") for name in EXPORT_VARIANTS}
+
+        def work(job):
+            # Decoded and annotated once, then every variant is encoded from the same frames
+            # Unchanged clips and settings are copied from the export cache instead of encoded again
+            return export_variants(self.timeline, self.annotation_index, job, outputs, int(TARGET_SIZE_MB * 1024 * 1024), FPS,
+                                   self.webm_settings, DUPLICATE_THRESHOLD, self.export_cache)
+
+        def on_success(results):
+            for name, result in results.items():
+                if 'error' in result: print(f"DEBUG: Export {name} impossible: {result['error']}")
+            if results.get('gif_small', {}).get('full_quality'):
+                os.remove(results.pop('gif_small')['path']) # Same file as the original size GIF, no extra button
+            self._show_compression_dialog({name: result['path'] for name, result in results.items() if 'path' in result},
+                                          self._fold_summary(results['gif']['folded_frames'], results['gif']['bytes']))
+
+        def on_failure():
+            for path in outputs.values():
+                if os.path.exists(path): os.remove(path)
+
+        self._run_export_job("Export GIF en cours...", work, on_success, on_failure)
+
+    def _export_single_file(self, format_name, extension, write, fixed_rate=False):
+        # Saved to a temp file first so a failed encode never leaves a broken file behind
+        # fixed_rate outputs (WebM) expand folded frames again, folding saves them encoding time but no bytes
+        temp_path = os.path.join(tempfile.gettempdir(), f"export_{int(time.time())}.{extension}")
+
+        fold_summary = []
+
+        def work(job):
+            job.stage = "Sauvegarde"
+            # Runs of identical frames become one frame with the summed delay
+            fold = DuplicateFolder(DUPLICATE_THRESHOLD, job)
+            write(temp_path, self._export_stream(job, fold=fold), job)
+            if not fixed_rate: fold_summary.append(self._fold_summary(fold.folded_frames, os.path.getsize(temp_path)))
+            return temp_path
+
+        def on_success(path):
+            copy_file_to_clipboard(path)
+            details = f"\n{fold_summary[0]}" if fold_summary and fold_summary[0] else ""
+            messagebox.showinfo("Succès", f"Fichier {format_name} sauvegardé et copié dans le presse-papier !{details}\n\n{path}")
+
+        def on_failure():
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+        self._run_export_job(f"Export {format_name} en cours...", work, on_success, on_failure)
 
     def export_as_webm(self):
-        final_frames, progress_win = self._prepare_frames_for_export("Export WebM en cours...")
-        if not final_frames: return
+        # The video runs at a constant rate: long frames are repeated so timestamps match their durations
+        self._export_single_file("WebM", "webm", lambda path, frames, job: write_webm(path, frames, FPS, job, self.webm_settings), fixed_rate=True)
 
-        try:
-            # Retrieve progress widgets from the window
-            progress_label = progress_win.winfo_children()[0]
-            progress_bar = progress_win.winfo_children()[1]
-
-            # Construct WebM path (same location as original project if possible, or temp)
-            # Using temp for consistency with GIF flow, but we could save directly.
-            # Let's save to a temp file first to ensure success.
-            temp_dir = tempfile.gettempdir()
-            temp_webm_path = os.path.join(temp_dir, f"export_{int(time.time())}.webm")
-
-            progress_label.config(text="Sauvegarde du WebM...")
-            progress_bar['value'] = 0
-            progress_bar['maximum'] = len(final_frames) # imageio writes all at once usually for video, but let's try to show progress if possible or just indeterminate
-            progress_win.update_idletasks()
-
-            # Ensure dimensions are divisible by 2 for video encoding
-            first_frame = final_frames[0]
-            height, width, _ = first_frame.shape
-            new_width = width if width % 2 == 0 else width - 1
-            new_height = height if height % 2 == 0 else height - 1
-            
-            if new_width != width or new_height != height:
-                print(f"Resizing for WebM: {width}x{height} -> {new_width}x{new_height}")
-                resized_frames = []
-                for frame in final_frames:
-                    img = Image.fromarray(frame)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-                    resized_frames.append(np.array(img))
-                final_frames = resized_frames
-
-            # Writing video might take time and doesn't easily support frame-by-frame callback with imageio.mimsave easily for progress bar without more complex setup.
-            # We will just use mimsave.
-            progress_bar.config(mode='indeterminate')
-            progress_bar.start()
-            
-            # Use libvpx-vp9 for better compression/quality, or libvpx. 
-            # pixelformat yuv420p is widely supported.
-            imageio.mimsave(temp_webm_path, final_frames, fps=FPS, format='WEBM', codec='libvpx', pixelformat='yuv420p')
-            
-            progress_win.destroy()
-            
-            copy_file_to_clipboard(temp_webm_path)
-            messagebox.showinfo("Succès", f"Fichier WebM sauvegardé et copié dans le presse-papier !\n\n{temp_webm_path}")
+    def export_as_webp(self):
+        # Per-frame durations are kept as-is, unchanged pixels are left transparent
+        self._export_single_file("WebP", "webp", lambda path, frames, job: write_webp(path, frames, job, lossless=WEBP_LOSSLESS, quality=WEBP_QUALITY, tolerance=DELTA_TOLERANCE if WEBP_LOSSLESS else 0))
 
-        except Exception as e:
-            if 'progress_win' in locals() and progress_win.winfo_exists():
-                progress_win.destroy()
-            messagebox.showerror("Erreur de Sauvegarde WebM", f"Une erreur est survenue: {e}\n\nAssurez-vous d'avoir les codecs nécessaires (ffmpeg).")
-            if 'temp_webm_path' in locals() and os.path.exists(temp_webm_path):
-                os.remove(temp_webm_path)
+    def export_as_apng(self):
+        self._export_single_file("APNG", "png", lambda path, frames, job: write_apng(path, frames, job, tolerance=DELTA_TOLERANCE))
 
-    def _show_compression_dialog(self, original_size_mb, estimated_compressed_size_mb, final_frames, temp_original_gif_path):
+    def _show_compression_dialog(self, ready_files, fold_summary=""):
+        temp_original_gif_path = ready_files['gif']
         dialog = tk.Toplevel(self.master); dialog.title("Options de Sauvegarde GIF"); set_dark_title_bar(dialog); dialog.transient(self.master); dialog.grab_set()
-        dialog.protocol("WM_DELETE_WINDOW", lambda: self._on_dialog_close(dialog, temp_original_gif_path))
+        dialog.protocol("WM_DELETE_WINDOW", lambda: self._on_dialog_close(dialog, ready_files.values()))
+        original_size_mb = os.path.getsize(temp_original_gif_path) / (1024 * 1024)
         tk.Label(dialog, text=f"Le fichier final fera {original_size_mb:.1f} Mo si vous le gardez dans sa taille originale.", wraplength=300).pack(pady=10)
-        tk.Label(dialog, text=f"Dans son état compressé, le fichier devrait faire environ : {estimated_compressed_size_mb:.1f} Mo", font=("", 8)).pack(pady=5)
-        def save_original():
-            self.status_label.config(text="Sauvegarde de la taille originale..."); self.master.update_idletasks()
+        if fold_summary: tk.Label(dialog, text=fold_summary, font=("", 8)).pack()
+        target_frame = tk.Frame(dialog); target_frame.pack(pady=5)
+        tk.Label(target_frame, text="Compresser sous (Mo) :", font=("", 8)).pack(side=tk.LEFT)
+        target_spinbox = tk.Spinbox(target_frame, from_=0.5, to=500, increment=0.5, width=6)
+        target_spinbox.delete(0, tk.END); target_spinbox.insert(0, str(TARGET_SIZE_MB))
+        target_spinbox.pack(side=tk.LEFT, padx=5)
+        def discard_others(kept_path):
+            for path in ready_files.values():
+                if path != kept_path and os.path.exists(path): os.remove(path)
+        def finish(path):
+            discard_others(path)
             if os.path.exists(self.original_gif_path): os.remove(self.original_gif_path)
-            shutil.move(temp_original_gif_path, self.original_gif_path)
+            shutil.move(path, self.original_gif_path)
+            if os.path.abspath(self.original_gif_path) == os.path.abspath(self.source_path):
+                self.discard_session() # The edits are now part of the source GIF
             copy_file_to_clipboard(self.original_gif_path)
-            dialog.destroy()
+            if dialog.winfo_exists(): dialog.destroy()
             self.status_label.config(text="Copié ! Fermeture dans 3s...")
-            self.master.after(3000, self.master.destroy)
+            self.master.after(3000, self.close_editor)
+        def finish_other_format(path):
+            discard_others(path)
+            copy_file_to_clipboard(path)
+            dialog.destroy()
+            messagebox.showinfo("Succès", f"Fichier sauvegardé et copié dans le presse-papier !\n\n{path}")
+            self.close_editor()
+        def save_original():
+            self.status_label.config(text="Sauvegarde de la taille originale..."); self.master.update_idletasks()
+            finish(temp_original_gif_path)
         def save_compressed():
-            self.status_label.config(text="Compression et sauvegarde..."); self.master.update_idletasks()
+            try:
+                target_bytes = int(float(target_spinbox.get().replace(',', '.')) * 1024 * 1024)
+            except ValueError:
+                messagebox.showerror("Erreur", "Veuillez entrer une taille valide en Mo.", parent=dialog)
+                return
+            if target_bytes >= os.path.getsize(temp_original_gif_path):
+                save_original() # Already under the budget
+                return
+            if 'gif_small' in ready_files and target_bytes == int(TARGET_SIZE_MB * 1024 * 1024):
+                finish(ready_files['gif_small']) # Encoded with the export
+                return
+            self.status_label.config(text="Compression et sauvegarde...")
             temp_compressed_gif_path_final = os.path.join(tempfile.gettempdir(), f"temp_compressed_gif_final_{int(time.time())}.gif")
-            original_fps, target_fps = FPS, 15
-            if target_fps < original_fps:
-                reduced_frames = []
-                num_original_frames, num_reduced_frames = len(final_frames), int(len(final_frames) * (target_fps / original_fps))
-                if num_reduced_frames == 0 and num_original_frames > 0: num_reduced_frames = 1
-                for i in range(num_reduced_frames):
-                    original_index = int(i * (original_fps / target_fps))
-                    if original_index < num_original_frames: reduced_frames.append(final_frames[original_index])
-                print(f"DEBUG: Reduced frames from {num_original_frames} to {len(reduced_frames)} for {target_fps} FPS.")
-                frames_to_save = reduced_frames
-            else: frames_to_save = final_frames
-            resized_frames = []
-            if frames_to_save:
-                first_frame_pil = Image.fromarray(frames_to_save[0])
-                original_width, original_height = first_frame_pil.size
-                new_width, new_height = int(original_width * 0.9), int(original_height * 0.9)
-                print(f"DEBUG: Resizing frames from {original_width}x{original_height} to {new_width}x{new_height}")
-                for frame_data in frames_to_save:
-                    pil_image = Image.fromarray(frame_data)
-                    resized_pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
-                    resized_frames.append(np.array(resized_pil_image))
-                frames_to_save = resized_frames
-            with imageio.get_writer(temp_compressed_gif_path_final, mode='I', fps=target_fps, subrectangles=True) as writer:
-                for frame in frames_to_save:
-                    writer.append_data(frame)
-            if os.path.exists(self.original_gif_path): os.remove(self.original_gif_path)
-            shutil.move(temp_compressed_gif_path_final, self.original_gif_path)
-            copy_file_to_clipboard(self.original_gif_path)
-            dialog.destroy()
-            self.status_label.config(text="Copié ! Fermeture dans 3s...")
-            self.master.after(3000, self.master.destroy)
+            def work(job):
+                # Sampled estimates pick scale, FPS, palette size and tolerance, then a single final encode
+                report, settings = export_gif_to_size(temp_compressed_gif_path_final, self.timeline, self.annotation_index, job, target_bytes,
+                                                      fold_threshold=DUPLICATE_THRESHOLD)
+                print(f"DEBUG: Compression {settings} -> {report['bytes'] / (1024 * 1024):.2f} Mo")
+                self._log_gif_report(report)
+                return temp_compressed_gif_path_final
+            def on_success(path):
+                finish(path)
+            def on_failure():
+                if os.path.exists(temp_compressed_gif_path_final): os.remove(temp_compressed_gif_path_final)
+                if dialog.winfo_exists(): dialog.grab_set()
+            dialog.grab_release()
+            self._run_export_job("Compression du GIF...", work, on_success, on_failure)
         btn_frame = tk.Frame(dialog); btn_frame.pack(pady=10)
         tk.Button(btn_frame, text="Taille Originale", command=save_original).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Compresser...", command=save_compressed).pack(side=tk.LEFT, padx=5)
+        # Variants encoded during the same pass, ready instantly
+        ready_frame = tk.Frame(dialog); ready_frame.pack(pady=(0, 10))
+        labels = {'gif_small': "GIF compressé", 'webm': "WebM", 'poster': "Image fixe"}
+        for name, label in labels.items():
+            if name not in ready_files: continue
+            path = ready_files[name]
+            command = (lambda p=path: finish(p)) if name == 'gif_small' else (lambda p=path: finish_other_format(p))
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            tk.Button(ready_frame, text=f"{label} ({size_mb:.1f} Mo)", command=command).pack(side=tk.LEFT, padx=5)
         dialog.update_idletasks()
         x, y = self.master.winfo_x() + (self.master.winfo_width() // 2) - (dialog.winfo_width() // 2), self.master.winfo_y() + (self.master.winfo_height() // 2) - (dialog.winfo_height() // 2)
         dialog.geometry(f"+{x}+{y}")
-        self.master.wait_window(dialog)
 
-    def _on_dialog_close(self, dialog, temp_original_gif_path):
-        if os.path.exists(temp_original_gif_path): os.remove(temp_original_gif_path)
-        dialog.destroy(); self.master.destroy()
+    def _on_dialog_close(self, dialog, temp_paths):
+        for path in temp_paths:
+            if os.path.exists(path): os.remove(path)
+        dialog.destroy(); self.close_editor()
 
     
 
+def run_editor_host(address, authkey):
+    """Warm editor kept alive by the recorder: modules are already imported, each 'open' request
+    becomes a window in this process. It leaves once the recorder is gone and no window is left."""
+    root = tk.Tk()
+    root.withdraw()
+    get_annotation_font(20)
+    requests = queue.Queue()
+    listener = Listener(address, authkey=authkey)
+
+    def watch_recorder(conn):
+        # The recorder keeps this connection open for as long as it runs
+        try:
+            while True: conn.recv()
+        except (EOFError, OSError): pass
+        requests.put(({'command': 'quit'}, None))
+
+    def listen():
+        while True:
+            try:
+                conn = listener.accept()
+                message = conn.recv()
+            except Exception as e:
+                print(f"DEBUG: Requête refusée: {e}")
+                continue
+            if isinstance(message, dict) and message.get('command') == 'attach':
+                threading.Thread(target=watch_recorder, args=(conn,), daemon=True).start()
+            else:
+                requests.put((message, conn)) # Answered by poll() once the request is handled
+
+    threading.Thread(target=listen, daemon=True).start()
+    quitting = False
+    def poll():
+        nonlocal quitting
+        while not requests.empty():
+            message, conn = requests.get()
+            try:
+                if message.get('command') == 'open':
+                    window = tk.Toplevel(root)
+                    try: GifEditorApp(window, path=message['path'], requested_at=message.get('requested_at'), shared=message.get('shared'))
+                    except Exception:
+                        window.destroy()
+                        raise
+                    if conn: conn.send({'opened': True})
+                elif message.get('command') == 'quit':
+                    quitting = True
+            except Exception as e:
+                # Without an answer the recorder starts a separate editor instead
+                print(f"DEBUG: Requête {message!r} en échec: {e}")
+            finally:
+                if conn: conn.close()
+        if quitting and not root.winfo_children():
+            listener.close()
+            root.destroy()
+            return
+        root.after(HOST_POLL_MS, poll)
+    poll()
+    root.mainloop()
+
 def main():
+    freeze_support() # Batch worker processes of the frozen build start through this entry point
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        from gif_batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--host':
+        address, authkey = os.environ.pop(EDITOR_HOST_ENV).rsplit('|', 1)
+        run_editor_host(address, bytes.fromhex(authkey))
+        return
     root = tk.Tk()
-    app = GifEditorApp(root)
+    gif_startup.mark("tk root")
+    requested_at = os.environ.pop(REQUESTED_AT_ENV, None)
+    path, shared = None, None
+    if len(sys.argv) > 3 and sys.argv[1] == '--shared': # --shared <project folder> <descriptor JSON>
+        path, shared = sys.argv[2], json.loads(sys.argv[3])
+    app = GifEditorApp(root, path=path, requested_at=float(requested_at) if requested_at else None, shared=shared)
+    gif_startup.mark("editor window")
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,492 @@
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+from PIL import Image, ImageFile
+
+# --- Configuration ---
+PALETTE_SAMPLE_PIXELS = 250_000 # Pixels kept when building a palette from a whole clip
+SCENE_CHANGE_ERROR = 48 # Mean squared mapping error that makes the adaptive mode build a new palette
+DITHER_STRENGTH = 8 # Amplitude of the ordered dither, one step of the 5-bit lookup grid
+
+BAYER_4X4 = np.array([[0, 8, 2, 10],
+                      [12, 4, 14, 6],
+                      [3, 11, 1, 9],
+                      [15, 7, 13, 5]], dtype=np.float32) / 16 - 0.5
+
+
+# --- Palettes ---
+def _pack_rgb(pixels):
+    pixels = pixels.reshape(-1, 3).astype(np.uint32)
+    return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+
+def _unpack_rgb(keys):
+    return np.stack([(keys >> 16) & 255, (keys >> 8) & 255, keys & 255], axis=1).astype(np.uint8)
+
+def median_cut_palette(pixels, colors=255):
+    """Builds a palette of at most `colors` entries from (N, 3) uint8 pixels.
+    Clips with few distinct colours (typical screen content) keep them exactly."""
+    keys, counts = np.unique(_pack_rgb(pixels), return_counts=True)
+    unique = _unpack_rgb(keys)
+    if len(unique) <= colors:
+        return unique
+    def box_entry(box, weights):
+        score = (box.max(0) - box.min(0)).max() * weights.sum() if len(box) > 1 else -1
+        return score, box, weights
+
+    boxes = [box_entry(unique.astype(np.int32), counts)]
+    while len(boxes) < colors:
+        # Split the box with the widest channel range, weighted by how many pixels it covers
+        best = max(range(len(boxes)), key=lambda i: boxes[i][0])
+        if boxes[best][0] <= 0: break
+        _, box, weights = boxes.pop(best)
+        channel = int(np.argmax(box.max(0) - box.min(0)))
+        order = np.argsort(box[:, channel], kind='stable')
+        box, weights = box[order], weights[order]
+        split = int(np.searchsorted(np.cumsum(weights), weights.sum() / 2))
+        split = min(max(split, 1), len(box) - 1)
+        boxes += [box_entry(box[:split], weights[:split]), box_entry(box[split:], weights[split:])]
+    palette = [np.average(box, axis=0, weights=weights) for _, box, weights in boxes]
+    return np.clip(np.rint(palette), 0, 255).astype(np.uint8)
+
+def sample_pixels(frames, limit=PALETTE_SAMPLE_PIXELS):
+    """Strided pixel sample spread evenly over a list of frames."""
+    per_frame = max(1, limit // max(1, len(frames)))
+    samples = []
+    for frame in frames:
+        pixels = frame[..., :3].reshape(-1, 3)
+        samples.append(pixels[::max(1, len(pixels) // per_frame)])
+    return np.concatenate(samples) if samples else np.zeros((0, 3), dtype=np.uint8)
+
+
+class ColorMapper:
+    """Nearest-colour mapping through a 32768-entry lookup table (5 bits per channel).
+    Colours present in the palette are always mapped exactly."""
+    def __init__(self, palette, dither=False):
+        self.palette = palette
+        self.dither = dither
+        self.keys = _pack_rgb(palette)
+        self._key_order = np.argsort(self.keys)
+        self._sorted_keys = self.keys[self._key_order]
+        self._lut = self._build_lut(palette.astype(np.int32))
+
+    @staticmethod
+    def _build_lut(palette):
+        cells = np.arange(32768, dtype=np.int32)
+        centres = (np.stack([(cells >> 10) & 31, (cells >> 5) & 31, cells & 31], axis=1) * 8 + 4).astype(np.float32)
+        palette = palette.astype(np.float32)
+        # |c - p|^2 without the |c|^2 term, which is the same for every palette entry
+        distances = (palette ** 2).sum(axis=1)[None, :] - 2 * centres @ palette.T
+        return distances.argmin(axis=1).astype(np.uint8)
+
+    @staticmethod
+    def _lut_keys(keys):
+        return ((keys >> 9) & 0x7c00) | ((keys >> 6) & 0x3e0) | ((keys >> 3) & 0x1f)
+
+    def map(self, frame):
+        height, width = frame.shape[:2]
+        rgb = frame[..., :3]
+        keys = _pack_rgb(rgb).reshape(height, width)
+        if self.dither:
+            threshold = np.tile(BAYER_4X4, (height // 4 + 1, width // 4 + 1))[:height, :width, None]
+            dithered = np.clip(rgb + threshold * DITHER_STRENGTH * 2, 0, 255).astype(np.uint8)
+            indices = self._lut[self._lut_keys(_pack_rgb(dithered).reshape(height, width))]
+        else:
+            indices = self._lut[self._lut_keys(keys)]
+        position = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+        exact = self._sorted_keys[position] == keys
+        indices[exact] = self._key_order[position[exact]]
+        return indices
+
+    def error(self, frame, indices):
+        """Mean squared distance between the frame and its mapped colours."""
+        if not frame.size: return 0.0
+        return float(((frame[..., :3].astype(np.int32) - self.palette[indices]) ** 2).sum(axis=-1).mean())
+
+
+# --- Encoder ---
+def _changed_pixels(new_keys, old_keys, tolerance):
+    if tolerance <= 0:
+        return new_keys != old_keys
+    changed = np.zeros(new_keys.shape, dtype=bool)
+    for shift in (16, 8, 0):
+        difference = ((new_keys >> shift) & 255).astype(np.int16) - ((old_keys >> shift) & 255).astype(np.int16)
+        changed |= np.abs(difference) > tolerance
+    return changed
+
+def _lzw_block(indices):
+    """GIF image data (min code size, sub-blocks, terminator) compressed by Pillow's C LZW encoder."""
+    image = Image.fromarray(np.ascontiguousarray(indices), mode='L')
+    buffer = io.BytesIO()
+    buffer.write(b'\x08')
+    ImageFile._save(image, buffer, [("gif", (0, 0) + image.size, 0, "L")])
+    buffer.write(b'\x00')
+    return buffer.getvalue()
+
+def _color_table(palette):
+    """Palette bytes padded to a power of two, with one spare slot kept for transparency."""
+    bits = max(1, int(np.ceil(np.log2(len(palette) + 1))))
+    table = np.zeros((1 << bits, 3), dtype=np.uint8)
+    table[:len(palette)] = palette
+    return table.tobytes(), bits - 1
+
+
+class _AnimationEncoder:
+    """Output handling and size reporting shared by the streaming encoders.
+    `output` is a path or a seekable binary file object."""
+    def __init__(self, output):
+        self.frame_sizes = [] # Bytes written per stored frame
+        self.merged_frames = 0 # Identical frames folded into the previous frame's delay
+        self.bytes_written = 0
+        self._owns_file = isinstance(output, (str, os.PathLike))
+        self._fp = open(output, 'wb') if self._owns_file else output
+        self._start = self._fp.tell()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, data):
+        self._fp.write(data)
+        self.bytes_written += len(data)
+
+    def _patch(self, offset, data):
+        """Rewrites bytes already written (headers that need the final frame count or size)."""
+        end = self._fp.tell()
+        self._fp.seek(self._start + offset)
+        self._fp.write(data)
+        self._fp.seek(end)
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        try:
+            self._flush()
+            self._finish()
+        finally:
+            if self._owns_file: self._fp.close()
+
+    def report(self):
+        sizes = self.frame_sizes
+        return {
+            'frames': len(sizes),
+            'merged_frames': self.merged_frames,
+            'bytes': self.bytes_written,
+            'bytes_per_frame': sum(sizes) / len(sizes) if sizes else 0,
+            'largest_frame': max(sizes, default=0),
+        }
+
+
+class GifEncoder(_AnimationEncoder):
+    """Streaming GIF writer. Frames are quantized against a global palette (or per-scene palettes
+    when none is given), only the pixels that changed are stored, as a cropped rectangle with the
+    rest transparent, and identical frames extend the previous frame's delay."""
+    def __init__(self, output, palette=None, colors=255, dither=False, lossy=0, loop=None):
+        super().__init__(output)
+        self.colors = min(colors, 255) # One index is reserved for transparency
+        self.dither = dither
+        self.lossy = lossy # Per-channel difference still treated as "unchanged"
+        self.loop = loop
+        if palette is not None: palette = np.asarray(palette, dtype=np.uint8)[:255]
+        self._adaptive = palette is None
+        self.mapper = ColorMapper(palette, dither) if palette is not None else None
+        self.global_palette = self.mapper.palette if self.mapper else None
+        self._canvas = None
+        self._pending = None
+
+    def _write_header(self, width, height):
+        header = b'GIF89a' + struct.pack('<HH', width, height)
+        if self.global_palette is not None:
+            table, size_bits = _color_table(self.global_palette)
+            header += bytes([0x80 | 0x70 | size_bits, 0, 0]) + table
+        else:
+            header += bytes([0x70, 0, 0])
+        if self.loop is not None:
+            header += b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00'
+        self._write(header)
+
+    def add_frame(self, frame, duration):
+        frame = frame[..., :3]
+        if self._canvas is None:
+            if self.mapper is None:
+                self.mapper = ColorMapper(median_cut_palette(sample_pixels([frame]), self.colors), self.dither)
+                self.global_palette = self.mapper.palette
+            self._write_header(frame.shape[1], frame.shape[0])
+            self._canvas = np.zeros(frame.shape[:2], dtype=np.uint32) # Packed RGB shown by the viewer
+            indices = self.mapper.map(frame)
+            changed = np.ones(frame.shape[:2], dtype=bool)
+        else:
+            indices = self.mapper.map(frame)
+            # Compare what the viewer would show, so quantization noise is not re-encoded every frame
+            changed = _changed_pixels(self.mapper.keys[indices], self._canvas, self.lossy)
+            if not changed.any():
+                self._pending[4] += duration
+                self.merged_frames += 1
+                return
+
+        rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        region, region_changed = frame[y0:y1, x0:x1], changed[y0:y1, x0:x1]
+        region_indices = indices[y0:y1, x0:x1]
+        if self._adaptive and self.mapper.error(region[region_changed], region_indices[region_changed]) > SCENE_CHANGE_ERROR:
+            # New scene: the changed pixels get their own palette, sent as a local color table
+            self.mapper = ColorMapper(median_cut_palette(sample_pixels([region]), self.colors), self.dither)
+            region_indices = self.mapper.map(region)
+        local_palette = self.mapper.palette if self.mapper.palette is not self.global_palette else None
+
+        transparent = None
+        if not region_changed.all():
+            transparent = len(self.mapper.palette)
+            region_indices = np.where(region_changed, region_indices, transparent).astype(np.uint8)
+        canvas = self._canvas[y0:y1, x0:x1]
+        canvas[region_changed] = self.mapper.keys[region_indices[region_changed]]
+
+        self._flush()
+        self._pending = [(x0, y0, x1 - x0, y1 - y0), region_indices, local_palette, transparent, duration]
+
+    def _flush(self):
+        if self._pending is None: return
+        (x, y, width, height), indices, local_palette, transparent, duration = self._pending
+        flags = (1 << 2) | (transparent is not None) # Disposal 1: leave the frame in place
+        data = b'\x21\xf9\x04' + bytes([flags]) + struct.pack('<H', max(1, round(duration / 10))) + bytes([transparent or 0, 0])
+        data += b'\x2c' + struct.pack('<HHHH', x, y, width, height)
+        if local_palette is not None:
+            table, size_bits = _color_table(local_palette)
+            data += bytes([0x80 | size_bits]) + table
+        else:
+            data += b'\x00'
+        data += _lzw_block(indices)
+        self._write(data)
+        self.frame_sizes.append(len(data))
+        self._pending = None
+
+    def _finish(self):
+        if self._canvas is not None: self._write(b';')
+
+
+# --- APNG / WebP ---
+def _changed_region(frame, previous, tolerance=0, align=1):
+    """Bounding box (x0, y0, x1, y1) of the pixels that differ from the previous frame, or None."""
+    if tolerance > 0:
+        changed = (np.abs(frame.astype(np.int16) - previous).max(axis=2) > tolerance)
+    else:
+        changed = np.any(frame != previous, axis=2)
+    rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+    if not len(rows): return None, changed
+    x0, y0 = cols[0] - cols[0] % align, rows[0] - rows[0] % align
+    return (x0, y0, cols[-1] + 1, rows[-1] + 1), changed
+
+def _delta_rgba(frame, changed, region):
+    """Changed pixels of the region, everything else fully transparent (and black, which compresses best)."""
+    x0, y0, x1, y1 = region
+    mask = changed[y0:y1, x0:x1]
+    rgba = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+    rgba[mask, :3] = frame[y0:y1, x0:x1][mask]
+    rgba[mask, 3] = 255
+    return rgba
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def _riff_chunks(data):
+    """(fourcc, payload) pairs of a RIFF body."""
+    chunks, offset = [], 0
+    while offset + 8 <= len(data):
+        kind, size = data[offset:offset + 4], struct.unpack('<I', data[offset + 4:offset + 8])[0]
+        chunks.append((kind, data[offset + 8:offset + 8 + size]))
+        offset += 8 + size + (size & 1)
+    return chunks
+
+def _riff_chunk(kind, payload):
+    return kind + struct.pack('<I', len(payload)) + payload + (b'\x00' if len(payload) & 1 else b'')
+
+
+class _DeltaEncoder(_AnimationEncoder):
+    def _remember(self, frame, changed):
+        """Tracks what the viewer shows: with a tolerance, skipped pixels keep their older value."""
+        if self._previous is None or changed.all():
+            self._previous = frame.copy()
+        else:
+            self._previous[changed] = frame[changed]
+
+
+class ApngEncoder(_DeltaEncoder):
+    """Streaming APNG writer. After the first frame, each frame stores the rectangle of changed
+    pixels over a transparent background and is alpha-blended onto the previous one.
+    Pillow compresses each rectangle; this class only writes the animation chunks."""
+    def __init__(self, output, compress_level=6, tolerance=0, loop=0):
+        super().__init__(output)
+        self.tolerance = tolerance # Per-channel difference still treated as "unchanged" (JPEG noise)
+        self.compress_level = compress_level
+        self.loop = loop
+        self._previous = None
+        self._pending = None
+        self._sequence = 0
+        self._actl_offset = None
+
+    def _compressed(self, rgba):
+        buffer = io.BytesIO()
+        Image.fromarray(rgba, 'RGBA').save(buffer, 'PNG', compress_level=self.compress_level)
+        data, offset, idat = buffer.getvalue(), 8, []
+        while offset < len(data):
+            length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+            if kind == b'IDAT': idat.append(data[offset + 8:offset + 8 + length])
+            offset += 12 + length
+        return b''.join(idat)
+
+    def add_frame(self, frame, duration):
+        frame = np.ascontiguousarray(frame[..., :3])
+        height, width = frame.shape[:2]
+        if self._previous is None:
+            self._write(b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+            self._actl_offset = self.bytes_written
+            self._write(_png_chunk(b'acTL', struct.pack('>II', 0, self.loop))) # Frame count patched on close
+            region, changed = (0, 0, width, height), np.ones((height, width), dtype=bool)
+        else:
+            region, changed = _changed_region(frame, self._previous, self.tolerance)
+            if region is None:
+                self._pending[2] += duration
+                self.merged_frames += 1
+                return
+        self._flush()
+        self._remember(frame, changed)
+        self._pending = [region, self._compressed(_delta_rgba(frame, changed, region)), duration]
+
+    def _flush(self):
+        if self._pending is None: return
+        (x0, y0, x1, y1), data, duration = self._pending
+        first = not self.frame_sizes
+        blend = 0 if first else 1 # APNG_BLEND_OP_SOURCE for the keyframe, OVER for deltas
+        control = struct.pack('>IIIIIHHBB', self._sequence, x1 - x0, y1 - y0, x0, y0, min(duration, 65535), 1000, 0, blend)
+        chunks = _png_chunk(b'fcTL', control)
+        self._sequence += 1
+        if first:
+            chunks += _png_chunk(b'IDAT', data)
+        else:
+            chunks += _png_chunk(b'fdAT', struct.pack('>I', self._sequence) + data)
+            self._sequence += 1
+        self._write(chunks)
+        self.frame_sizes.append(len(chunks))
+        self._pending = None
+
+    def _finish(self):
+        if self._previous is None: return
+        self._patch(self._actl_offset, _png_chunk(b'acTL', struct.pack('>II', len(self.frame_sizes), self.loop)))
+        self._write(_png_chunk(b'IEND', b''))
+
+
+class WebpEncoder(_DeltaEncoder):
+    """Streaming animated WebP writer. Each frame is encoded as a still WebP by Pillow (lossless
+    or lossy) and muxed into an ANMF chunk; frames after the first only carry their changed rectangle."""
+    def __init__(self, output, lossless=True, quality=80, method=4, tolerance=0, loop=0):
+        super().__init__(output)
+        self.tolerance = tolerance
+        self.lossless = lossless
+        self.quality = quality
+        self.method = method # 0 (fast) to 6 (smallest)
+        self.loop = loop
+        self._previous = None
+        self._pending = None
+
+    def _compressed(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', lossless=self.lossless, quality=self.quality, method=self.method, exact=False)
+        # A still WebP is RIFF/WEBP around VP8/VP8L (and ALPH); ANMF wants those chunks without VP8X
+        return b''.join(_riff_chunk(kind, payload) for kind, payload in _riff_chunks(buffer.getvalue()[12:]) if kind != b'VP8X')
+
+    def add_frame(self, frame, duration):
+        frame = np.ascontiguousarray(frame[..., :3])
+        height, width = frame.shape[:2]
+        if self._previous is None:
+            canvas = struct.pack('<I', width - 1)[:3] + struct.pack('<I', height - 1)[:3]
+            self._write(b'RIFF\x00\x00\x00\x00WEBP' # RIFF size patched on close
+                        + _riff_chunk(b'VP8X', bytes([0x10 | 0x02, 0, 0, 0]) + canvas) # Alpha + animation flags
+                        + _riff_chunk(b'ANIM', b'\x00\x00\x00\x00' + struct.pack('<H', self.loop)))
+            region, image = (0, 0, width, height), Image.fromarray(frame)
+            changed = np.ones((height, width), dtype=bool)
+        else:
+            region, changed = _changed_region(frame, self._previous, self.tolerance, align=2) # ANMF offsets are stored halved
+            if region is None:
+                self._pending[2] += duration
+                self.merged_frames += 1
+                return
+            image = Image.fromarray(_delta_rgba(frame, changed, region), 'RGBA')
+        self._flush()
+        self._remember(frame, changed)
+        self._pending = [region, self._compressed(image), duration]
+
+    def _flush(self):
+        if self._pending is None: return
+        (x0, y0, x1, y1), data, duration = self._pending
+        blend = 0x02 if not self.frame_sizes else 0x00 # The keyframe replaces the canvas, deltas are alpha-blended
+        header = b''.join(struct.pack('<I', value)[:3] for value in (x0 // 2, y0 // 2, x1 - x0 - 1, y1 - y0 - 1, min(duration, 0xFFFFFF)))
+        chunk = _riff_chunk(b'ANMF', header + bytes([blend]) + data)
+        self._write(chunk)
+        self.frame_sizes.append(len(chunk))
+        self._pending = None
+
+    def _finish(self):
+        if self._previous is None: return
+        self._patch(4, struct.pack('<I', self.bytes_written - 8))
+
+
+# --- Benchmark ---
+def _benchmark(path):
+    """Compares the native encoders against imageio's GIF writer on a project folder or GIF."""
+    import imageio.v2 as imageio
+    from gif_engine import FrameStore
+
+    store = FrameStore.from_project_folder(path) if os.path.isdir(path) else FrameStore.from_gif(path)
+    frames = [store.get(i) for i in range(len(store))]
+    durations = store.durations or [50] * len(frames)
+    output = os.path.join(tempfile.gettempdir(), "gif_encoder_benchmark.gif")
+
+    def imageio_path():
+        with imageio.get_writer(output, mode='I', duration=durations, subrectangles=True) as writer:
+            for frame in frames: writer.append_data(frame)
+        return None
+
+    def native(encoder_class=None, **options):
+        def run():
+            with (encoder_class or GifEncoder)(output, **options) as encoder:
+                for frame, duration in zip(frames, durations): encoder.add_frame(frame, duration)
+            return encoder.report()
+        return run
+
+    print(f"{len(frames)} frames, {frames[0].shape[1]}x{frames[0].shape[0]}")
+    global_palette = median_cut_palette(sample_pixels(frames))
+    for name, run in [("imageio", imageio_path),
+                      ("native, global palette", native(palette=global_palette)),
+                      ("native, global palette + dither", native(palette=global_palette, dither=True)),
+                      ("native, per-scene palettes", native()),
+                      ("native, global palette, lossy 8", native(palette=global_palette, lossy=8)),
+                      ("APNG", native(ApngEncoder)),
+                      ("APNG, tolerance 8", native(ApngEncoder, tolerance=8)),
+                      ("WebP lossless", native(WebpEncoder)),
+                      ("WebP lossless, tolerance 8", native(WebpEncoder, tolerance=8)),
+                      ("WebP lossy q80", native(WebpEncoder, lossless=False, quality=80))]:
+        start = time.perf_counter()
+        report = run()
+        elapsed = time.perf_counter() - start
+        line = f"{name:<34} {elapsed:7.2f} s {os.path.getsize(output) / 1024:9.1f} Ko"
+        if report: line += f"  {report['bytes_per_frame'] / 1024:7.1f} Ko/image, {report['merged_frames']} fusionnées"
+        print(line)
+    os.remove(output)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python gif_encoders.py <dossier de projet | fichier.gif>")
+        sys.exit(1)
+    _benchmark(sys.argv[1])
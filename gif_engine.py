@@ -0,0 +1,1249 @@
+import hashlib
+import io
+import json
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import accumulate, islice
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from gif_encoders import ApngEncoder, GifEncoder, WebpEncoder, median_cut_palette, sample_pixels
+
+# --- Configuration ---
+FRAME_CACHE_MAX_BYTES = 1024 * 1024 * 1024 # Budget for decoded frames kept in RAM
+PREFETCH_COUNT = 8 # Frames decoded ahead of the scrub direction
+DECODE_WORKERS = os.cpu_count() or 1
+EXPORT_WORKERS = os.cpu_count() or 1 # Threads annotating and resizing frames during export
+EXPORT_CHUNK_SIZE = 4 # Consecutive frames handed to one export worker
+PALETTE_SAMPLE_FRAMES = 16 # Frames sampled to build the global GIF palette
+FRAME_DURATION_MS = 50 # Display time of one captured frame (20 FPS)
+MIN_FRAME_DURATION_MS = 20 # Viewers clamp shorter GIF delays
+GIF_RAW_FRAMES_MAX_BYTES = 256 * 1024 * 1024 # Decoded GIF frames kept as they are, further frames are kept zlib-compressed
+GIF_FRAME_COMPRESSION = 1 # Fastest zlib level, GIF content packs well
+TARGET_SIZE_MB = 8 # Default size budget of a compressed GIF (chat upload limits)
+DUPLICATE_THRESHOLD = 6 # Per-channel difference under which consecutive frames are folded at export (0 = exact only)
+
+
+def imap_ordered(func, items, workers):
+    """Like map(), but runs func on a thread pool and keeps a bounded number of items in flight."""
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(func, item) for item in islice(items, workers * 2))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+
+
+# --- Planar YUV 4:2:0 ---
+# I420 layout (full Y plane, then quarter-size U and V planes) in one array: 1.5 bytes per pixel instead of 3.
+# BT.601 limited range in integer math, the matrix ffmpeg assumes for untagged yuv420p input.
+Yuv420Frame = namedtuple('Yuv420Frame', ['data', 'width', 'height'])
+
+def yuv420_planes(frame):
+    """Y, U and V views into frame.data."""
+    luma, chroma = frame.width * frame.height, (frame.width // 2) * (frame.height // 2)
+    return (frame.data[:luma].reshape(frame.height, frame.width),
+            frame.data[luma:luma + chroma].reshape(frame.height // 2, frame.width // 2),
+            frame.data[luma + chroma:].reshape(frame.height // 2, frame.width // 2))
+
+def bgr_to_yuv420(frame):
+    """Converts a BGR(A) frame. Chroma is averaged over 2x2 blocks, so an odd last row/column is dropped."""
+    height, width = frame.shape[0] & ~1, frame.shape[1] & ~1
+    frame = frame[:height, :width]
+    result = Yuv420Frame(np.empty(width * height * 3 // 2, dtype=np.uint8), width, height)
+    y, u, v = yuv420_planes(result)
+    b, g, r = frame[..., 0], frame[..., 1], frame[..., 2]
+    # uint16 is enough for luma (positive weights, at most 56228); products are taken from the uint8 views, no widened copies
+    luma = np.multiply(r, 66, dtype=np.uint16)
+    luma += np.multiply(g, 129, dtype=np.uint16)
+    luma += np.multiply(b, 25, dtype=np.uint16)
+    luma += 128
+    luma >>= 8
+    np.add(luma, 16, out=y, casting='unsafe')
+    # Sums of each 2x2 block (0..1020), the extra >> 2 of the chroma formulas averages them
+    def block_sums(channel):
+        rows = channel[0::2].astype(np.uint16)
+        rows += channel[1::2]
+        return (rows[:, 0::2] + rows[:, 1::2]).astype(np.int32)
+    b, g, r = block_sums(b), block_sums(g), block_sums(r)
+    np.add((b * 112 - r * 38 - g * 74 + 512) >> 10, 128, out=u, casting='unsafe')
+    np.add((r * 112 - g * 94 - b * 18 + 512) >> 10, 128, out=v, casting='unsafe')
+    return result
+
+def yuv420_to_rgb(frame):
+    """Converts back to a (height, width, 3) RGB array. Only done for frames that are saved or exported."""
+    y, u, v = yuv420_planes(frame)
+    d, e = u.astype(np.int32) - 128, v.astype(np.int32) - 128
+    # Chroma terms are computed at quarter size and broadcast over each 2x2 block of luma
+    c = (y.astype(np.int32) - 16).reshape(frame.height // 2, 2, frame.width // 2, 2) * 298 + 128
+    rgb = np.empty((frame.height, frame.width, 3), dtype=np.uint8)
+    for channel, chroma in enumerate((e * 409, -d * 100 - e * 208, d * 516)):
+        value = c + chroma[:, None, :, None]
+        value >>= 8
+        np.clip(value, 0, 255, out=value)
+        rgb[..., channel] = value.reshape(frame.height, frame.width)
+    return rgb
+
+def crop_yuv420(frame, x1, y1, x2, y2):
+    """Copy of the region, with its edges moved inwards to even coordinates (chroma covers 2x2 pixels)."""
+    x1, y1 = max(0, x1 + (x1 & 1)), max(0, y1 + (y1 & 1))
+    x2, y2 = min(frame.width, x2) & ~1, min(frame.height, y2) & ~1
+    if x2 <= x1 or y2 <= y1: return None
+    planes = yuv420_planes(frame)
+    boxes = ((y1, y2, x1, x2), (y1 // 2, y2 // 2, x1 // 2, x2 // 2), (y1 // 2, y2 // 2, x1 // 2, x2 // 2))
+    data = np.concatenate([plane[top:bottom, left:right].ravel() for plane, (top, bottom, left, right) in zip(planes, boxes)])
+    return Yuv420Frame(data, x2 - x1, y2 - y1)
+
+
+# --- Frame Decoders ---
+def _decode_image_file(path):
+    import imageio.v2 as imageio # Imported on first decode, the editor window is already up by then
+    frame = imageio.imread(path)
+    if frame.ndim == 2:
+        frame = np.stack([frame] * 3, axis=-1)
+    return frame[..., :3]
+
+def gif_frame_delays(data):
+    """Display time in ms of each frame of a GIF file's bytes, read from its Graphic Control Extensions
+    without decoding any pixels. Frames without a delay get FRAME_DURATION_MS."""
+    if data[:3] != b'GIF' or len(data) < 13: raise ValueError("Not a GIF file")
+
+    def skip_sub_blocks(position):
+        while position < len(data) and data[position]:
+            position += data[position] + 1
+        return position + 1
+
+    delays, delay = [], None
+    position = 13 + (3 << ((data[10] & 7) + 1) if data[10] & 0x80 else 0) # Header, screen descriptor, global palette
+    while position < len(data):
+        if data[position] == 0x21: # Extension, the graphic control one (0xF9) holds the delay of the next image
+            if data[position + 1] == 0xF9 and position + 6 <= len(data):
+                delay = int.from_bytes(data[position + 4:position + 6], 'little') * 10
+            position = skip_sub_blocks(position + 2)
+        elif data[position] == 0x2C and position + 10 <= len(data): # Image descriptor
+            flags = data[position + 9]
+            position += 10 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0)
+            position = skip_sub_blocks(position + 1) # LZW code size byte, then the image data
+            delays.append(delay or FRAME_DURATION_MS)
+            delay = None
+        else: break # Trailer
+    return delays
+
+class _GifFrameDecoder:
+    """Frames of a GIF file, decoded through Pillow in a single forward pass. A GIF frame is drawn over
+    the previous ones, so Pillow seeks backward by decoding again from frame 0: every decoded frame
+    is kept instead (zlib-compressed past GIF_RAW_FRAMES_MAX_BYTES) and random access reads it from there."""
+    sequential = True # One Pillow handle, FrameStore never decodes it from several threads
+
+    def __init__(self, path):
+        self.path = path
+        # Decoded from a copy in memory: the file is not held open, so the editor can overwrite it (Windows)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self._file_digest = hashlib.blake2b(data, digest_size=16).hexdigest() # Same value as file_digest(path)
+        self._image = Image.open(io.BytesIO(data))
+        # Counting frames through Pillow would decode every one of them before the first can be shown
+        self.durations = gif_frame_delays(data) or [FRAME_DURATION_MS] * getattr(self._image, 'n_frames', 1)
+        self.n_frames = len(self.durations)
+        self._decoded = [] # Frames decoded so far: RGB arrays, or (compressed bytes, shape)
+        self._raw_bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, index):
+        with self._lock:
+            frame = None
+            while len(self._decoded) <= index:
+                self._image.seek(len(self._decoded))
+                frame = np.asarray(self._image.convert("RGB"))
+                if self._raw_bytes + frame.nbytes <= GIF_RAW_FRAMES_MAX_BYTES:
+                    self._decoded.append(frame)
+                    self._raw_bytes += frame.nbytes
+                else:
+                    self._decoded.append((zlib.compress(frame.data, GIF_FRAME_COMPRESSION), frame.shape))
+            if frame is not None and len(self._decoded) == index + 1: return frame
+            decoded = self._decoded[index]
+        if isinstance(decoded, np.ndarray): return decoded
+        data, shape = decoded
+        return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+
+    def digest(self, index):
+        # The content this decoder reads, even once the file on disk has been replaced
+        return f"{self._file_digest}:{index}"
+
+    def close(self):
+        with self._lock:
+            self._image.close()
+            self._decoded = []
+
+class _SharedFrameDecoder:
+    """Frames published by the recorder in shared memory (see publish_shared_frames), read in place."""
+    def __init__(self, descriptor):
+        try: self._memory = shared_memory.SharedMemory(name=descriptor['name'], track=False) # Python 3.13+
+        except TypeError:
+            self._memory = shared_memory.SharedMemory(name=descriptor['name'])
+            if os.name == 'posix': # The recorder owns the segment, this process must not unlink it on exit
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self._memory._name, 'shared_memory')
+        shape = (descriptor['count'], descriptor['height'], descriptor['width'], 3)
+        self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self._memory.buf)
+
+    def __call__(self, index):
+        return self.frames[index]
+
+    def digest(self, index):
+        return hashlib.blake2b(self.frames[index], digest_size=16).hexdigest()
+
+    def close(self):
+        self.frames = None
+        try: self._memory.close()
+        except BufferError: pass # A frame is still referenced elsewhere, the mapping goes with it
+
+def publish_shared_frames(frames, bgr=False):
+    """Copies same-sized frames (arrays or Yuv420Frame) into one new shared memory segment, as RGB.
+    Returns the segment, which the caller closes and unlinks once the editor has attached, its RGB
+    frames array and the JSON-ready descriptor that FrameStore.from_shared_memory() opens."""
+    first = frames[0]
+    count, (height, width) = len(frames), (first.height, first.width) if isinstance(first, Yuv420Frame) else first.shape[:2]
+    memory = shared_memory.SharedMemory(create=True, size=count * height * width * 3)
+    shared = np.ndarray((count, height, width, 3), dtype=np.uint8, buffer=memory.buf)
+    for target, frame in zip(shared, frames):
+        if isinstance(frame, Yuv420Frame): target[...] = yuv420_to_rgb(frame)
+        else: target[...] = frame[..., 2::-1] if bgr else frame[..., :3]
+    return memory, shared, {'name': memory.name, 'count': count, 'height': height, 'width': width}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_size, stat.st_mtime_ns)
+
+@lru_cache(maxsize=65536)
+def _hash_file(path, size, mtime_ns):
+    # Size and mtime are part of the cache key so a rewritten file is hashed again
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(partial(f.read, 1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Frame Store ---
+_CLOSE_PREFETCH = object() # Sentinel request ending the prefetch thread
+
+class FrameStore:
+    """Decodes source frames on demand and keeps a bounded LRU of decoded frames."""
+    def __init__(self, sources, decoder, max_bytes=FRAME_CACHE_MAX_BYTES, durations=None):
+        self.sources = sources
+        self.durations = durations # Per-frame display time in ms, None for constant FRAME_DURATION_MS
+        self._decode = decoder
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._prefetch_request = None
+        self._prefetch_event = threading.Event()
+        self._prefetch_thread = None
+        self._closed = False
+        self.loaded_count = 0 # Contiguous prefix decoded by preload()
+
+    def source_digest(self, index):
+        """Content hash of a source frame: its JPG file, or the GIF file plus the frame number."""
+        source = self.sources[index]
+        if isinstance(source, str): return file_digest(source)
+        return self._decode.digest(source)
+
+    @classmethod
+    def from_project_folder(cls, folder):
+        jpg_files = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(".jpg")])
+        if not jpg_files:
+            raise ValueError("No .jpg frames found in the project folder.")
+        return cls(jpg_files, _decode_image_file)
+
+    @classmethod
+    def from_gif(cls, path):
+        decoder = _GifFrameDecoder(path)
+        return cls(list(range(decoder.n_frames)), decoder, durations=decoder.durations)
+
+    @classmethod
+    def from_shared_memory(cls, descriptor):
+        """Frames handed over by the recorder without going through JPG files. They already sit
+        in memory, so the whole clip counts as cached."""
+        decoder = _SharedFrameDecoder(descriptor)
+        return cls(list(range(descriptor['count'])), decoder, max_bytes=max(FRAME_CACHE_MAX_BYTES, decoder.frames.nbytes))
+
+    @classmethod
+    def open(cls, path):
+        """Project folder of JPG frames or GIF file."""
+        if os.path.isdir(path): return cls.from_project_folder(path)
+        if path.lower().endswith('.gif'): return cls.from_gif(path)
+        raise ValueError(f"Unsupported file or folder: {path}")
+
+    def __len__(self):
+        return len(self.sources)
+
+    def is_cached(self, index):
+        with self._lock:
+            return index in self._cache
+
+    def get(self, index):
+        with self._lock:
+            frame = self._cache.get(index)
+            if frame is not None:
+                self._cache.move_to_end(index)
+                return frame
+        return self._store(index, self._decode(self.sources[index]))
+
+    def _store(self, index, frame):
+        frame.flags.writeable = False # Source frames are shared, never modified in place
+        with self._lock:
+            if self._closed: return frame
+            if index in self._cache:
+                return self._cache[index]
+            self._cache[index] = frame
+            self._cache_bytes += frame.nbytes
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.nbytes
+        return frame
+
+    def fits_in_cache(self):
+        return len(self.sources) * self.get(0).nbytes <= self.max_bytes
+
+    def iter_frames(self, indices, workers=DECODE_WORKERS):
+        """Yields the frames for indices in order, decoding them across a thread pool
+        (a single thread for sequential decoders such as GIF files)."""
+        if getattr(self._decode, 'sequential', False): workers = 1
+        return imap_ordered(self.get, indices, workers)
+
+    def preload(self, workers=DECODE_WORKERS):
+        """Decodes every frame in parallel, advancing loaded_count as the decoded prefix grows."""
+        self.loaded_count = 0
+        for _ in self.iter_frames(range(len(self.sources)), workers):
+            if self._closed: break
+            self.loaded_count += 1
+
+    def prefetch(self, indices):
+        """Decodes the given indices in the background. A newer request replaces a pending one."""
+        if self._closed: return
+        self._prefetch_request = list(indices)
+        self._prefetch_event.set()
+        if self._prefetch_thread is None:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_worker, daemon=True)
+            self._prefetch_thread.start()
+
+    def _prefetch_worker(self):
+        # The thread holds a reference to the store: it runs until close() sends the sentinel
+        while True:
+            self._prefetch_event.wait()
+            self._prefetch_event.clear()
+            request, self._prefetch_request = self._prefetch_request, None
+            if request is _CLOSE_PREFETCH: return
+            for index in request or []:
+                if self._prefetch_request is not None: break # Scrub moved on, restart from the new position
+                if 0 <= index < len(self.sources) and not self.is_cached(index):
+                    try: self._store(index, self._decode(self.sources[index]))
+                    except Exception as e: print(f"Error prefetching frame {index}: {e}")
+
+    def close(self):
+        """Stops the prefetch thread, drops the decoded frames and closes the decoder. The editor calls
+        it when its window closes, a warm host process would keep the whole clip in memory otherwise."""
+        self._closed = True
+        self._prefetch_request = _CLOSE_PREFETCH
+        self._prefetch_event.set()
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+        if hasattr(self._decode, 'close'): self._decode.close()
+
+
+
+# --- Timeline ---
+TimelineEntry = namedtuple('TimelineEntry', ['source', 'duration']) # Source frame index, display time in ms
+
+class Timeline:
+    """Edit decision list: references to immutable source frames plus a virtual crop rectangle.
+    Edits return an op tuple that apply()/revert() replay, so undo only stores references."""
+    def __init__(self, store, entries=None, crop=None):
+        self.store = store
+        if entries is None:
+            durations = store.durations or [FRAME_DURATION_MS] * len(store)
+            entries = [TimelineEntry(i, duration) for i, duration in enumerate(durations)]
+        self.entries = list(entries)
+        self.crop = crop # (x1, y1, x2, y2) in source frame coordinates, or None
+        self._start_times = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def durations(self):
+        return [entry.duration for entry in self.entries]
+
+    def time_at(self, index):
+        """Start time of an entry in seconds."""
+        if self._start_times is None:
+            self._start_times = [0] + list(accumulate(self.durations()))
+        return self._start_times[min(index, len(self.entries))] / 1000
+
+    def index_after(self, index, ms):
+        """First entry starting at least ms after the start of entry index, len() when the timeline ends before."""
+        self.time_at(0) # Builds the start times
+        return min(bisect_left(self._start_times, self._start_times[index] + ms, lo=index + 1), len(self.entries))
+
+    def set_durations(self, start, durations):
+        new_entries = [entry._replace(duration=max(MIN_FRAME_DURATION_MS, round(d))) for entry, d in zip(self.entries[start:], durations)]
+        return self.splice(start, start + len(new_entries), new_entries)
+
+    def _crop_frame(self, frame):
+        if not self.crop: return frame
+        x1, y1, x2, y2 = self.crop
+        return frame[y1:y2, x1:x2]
+
+    def frame(self, index):
+        return self._crop_frame(self.store.get(self.entries[index].source))
+
+    def iter_frames(self, indices=None, workers=DECODE_WORKERS):
+        if indices is None: indices = range(len(self.entries))
+        sources = [self.entries[i].source for i in indices]
+        return (self._crop_frame(frame) for frame in self.store.iter_frames(sources, workers))
+
+    def prefetch(self, indices):
+        self.store.prefetch(self.entries[i].source for i in indices if 0 <= i < len(self.entries))
+
+    def splice(self, start, stop, new_entries):
+        op = ('splice', start, self.entries[start:stop], list(new_entries))
+        self.apply(op)
+        return op
+
+    def set_crop(self, crop):
+        op = ('crop', self.crop, crop)
+        self.apply(op)
+        return op
+
+    def crop_relative(self, x1, y1, x2, y2):
+        """Crops with a rectangle given in the currently displayed (already cropped) coordinates."""
+        ox, oy = (self.crop[0], self.crop[1]) if self.crop else (0, 0)
+        return self.set_crop((ox + x1, oy + y1, ox + x2, oy + y2))
+
+    def apply(self, op):
+        self._start_times = None
+        if op[0] == 'splice':
+            _, start, removed, added = op
+            self.entries[start:start + len(removed)] = added
+        elif op[0] == 'crop':
+            self.crop = op[2]
+
+    def revert(self, op):
+        self._start_times = None
+        if op[0] == 'splice':
+            _, start, removed, added = op
+            self.entries[start:start + len(added)] = removed
+        elif op[0] == 'crop':
+            self.crop = op[1]
+
+def to_constant_rate(frames, fps):
+    """Turns (frame, duration) pairs into a constant-rate frame stream, repeating long frames so timestamps stay exact."""
+    elapsed, shown = 0, 0
+    for frame, duration in frames:
+        elapsed += duration
+        total = max(shown + 1, round(elapsed * fps / 1000))
+        for _ in range(total - shown):
+            yield frame
+        shown = total
+
+def retime_frames(frames, target_fps):
+    """Drops (frame, duration) pairs so that no more than target_fps are shown per second.
+    The time of dropped frames goes to the frame that stays on screen."""
+    tick = 1000 / target_fps
+    kept, elapsed, next_tick = None, 0, 0
+    for frame, duration in frames:
+        if kept is None or elapsed >= next_tick - 1e-6:
+            if kept is not None: yield tuple(kept)
+            kept = [frame, 0]
+            next_tick = max(next_tick + tick, elapsed)
+        kept[1] += duration
+        elapsed += duration
+    if kept is not None: yield tuple(kept)
+
+def retime_for_fps(durations, target_fps):
+    """retime_frames() on frame indices: the (index, duration) pairs that stay."""
+    return list(retime_frames(enumerate(durations), target_fps))
+
+
+class DuplicateFolder:
+    """Folds runs of identical frames, or frames within `threshold` per channel of the frame
+    starting the run, into that first frame with the summed delay."""
+    def __init__(self, threshold=0, job=None):
+        self.threshold = threshold
+        self.job = job # Folded frames still count as progress
+        self.folded_frames = 0
+
+    def is_duplicate(self, frame, kept):
+        if frame.shape != kept.shape: return False
+        if self.threshold <= 0: return np.array_equal(frame, kept)
+        return int((np.maximum(frame, kept) - np.minimum(frame, kept)).max()) <= self.threshold
+
+    def fold(self, frames):
+        kept = None
+        for frame, duration in frames:
+            if kept is not None and self.is_duplicate(frame, kept[0]):
+                kept[1] += duration
+                self.folded_frames += 1
+                if self.job: self.job.advance()
+                continue
+            if kept is not None: yield tuple(kept)
+            kept = [frame, duration]
+        if kept is not None: yield tuple(kept)
+
+# --- Activity analysis ---
+ACTIVITY_THRESHOLD = 24 # Per-channel change that counts as activity rather than compression noise
+SCENE_CUT_FRACTION = 0.5 # Share of changed pixels that starts a new activity segment
+AUTO_CROP_MARGIN = 8 # Pixels kept around the detected activity
+
+ActivitySegment = namedtuple('ActivitySegment', ['start', 'stop', 'box']) # Timeline range, (x1, y1, x2, y2) or None
+
+def _span(mask):
+    hits = np.flatnonzero(mask)
+    return (int(hits[0]), int(hits[-1]) + 1) if hits.size else None
+
+def changed_mask(frame, previous, threshold=ACTIVITY_THRESHOLD):
+    """Pixels whose largest channel difference exceeds threshold."""
+    return (np.maximum(frame, previous) - np.minimum(frame, previous)).max(axis=2) > threshold
+
+def activity_segments(timeline, job=None, threshold=ACTIVITY_THRESHOLD):
+    """Bounding boxes of changing pixels, in displayed (cropped) coordinates, for each run of frames
+    between scene cuts. A cut is a frame change covering more than SCENE_CUT_FRACTION of the image."""
+    segments, start, previous = [], 0, None
+    rows = cols = None
+    def close(stop):
+        row_span, col_span = _span(rows), _span(cols)
+        box = (col_span[0], row_span[0], col_span[1], row_span[1]) if row_span else None
+        segments.append(ActivitySegment(start, stop, box))
+
+    for index, frame in enumerate(timeline.iter_frames()):
+        if job:
+            if job.cancel_event.is_set(): raise ExportCancelled()
+            job.advance()
+        if previous is not None:
+            changed = changed_mask(frame, previous, threshold) if frame.shape == previous.shape else None
+            if changed is None or changed.mean() > SCENE_CUT_FRACTION:
+                close(index)
+                start, rows = index, None
+            else:
+                rows |= changed.any(axis=1)
+                cols |= changed.any(axis=0)
+        if rows is None: rows, cols = np.zeros(frame.shape[0], bool), np.zeros(frame.shape[1], bool)
+        previous = frame
+    if previous is not None: close(len(timeline))
+    return segments
+
+def union_box(boxes):
+    boxes = [box for box in boxes if box]
+    if not boxes: return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def pad_box(box, width, height, margin=AUTO_CROP_MARGIN):
+    x1, y1, x2, y2 = box
+    return (max(0, x1 - margin), max(0, y1 - margin), min(width, x2 + margin), min(height, y2 + margin))
+
+MOTION_SAMPLE_STEP = 4 # Motion energy compares every 4th pixel in both directions
+IDLE_ENERGY = 0.0001 # Share of changed sampled pixels under which a frame counts as idle (about 13 samples on a 1080p frame)
+AUTO_TRIM_MARGIN_MS = 300 # Idle time kept before and after the active span
+
+def motion_energy(frames, job=None, step=MOTION_SAMPLE_STEP, threshold=ACTIVITY_THRESHOLD):
+    """Yields, for each frame, the share of its downsampled pixels that changed since the previous frame (0 for the first)."""
+    previous = None
+    for frame in frames:
+        if job:
+            if job.cancel_event.is_set(): raise ExportCancelled()
+            job.advance()
+        sample = frame[::step, ::step]
+        yield float(changed_mask(sample, previous, threshold).mean()) if previous is not None and sample.shape == previous.shape else 0.0
+        previous = sample
+
+def active_span(energy, durations, idle=IDLE_ENERGY, margin_ms=AUTO_TRIM_MARGIN_MS):
+    """(start, stop) range of frames holding the motion plus margin_ms of idle time on each side, or None without motion.
+    The still frame before the first change is part of the action: it is what the change starts from."""
+    active = [i for i, value in enumerate(energy) if value > idle]
+    if not active: return None
+    start, stop = max(0, active[0] - 1), active[-1] + 1
+    kept = 0
+    while start > 0 and kept < margin_ms:
+        start -= 1
+        kept += durations[start]
+    kept = 0
+    while stop < len(durations) and kept < margin_ms:
+        kept += durations[stop]
+        stop += 1
+    return start, stop
+
+# --- Annotations ---
+@lru_cache(maxsize=None)
+def get_annotation_font(font_size):
+    """Loads the annotation font once per size for the whole process."""
+    try: return ImageFont.truetype("candara.ttf", font_size)
+    except IOError:
+        try: return ImageFont.truetype("arial.ttf", font_size)
+        except IOError: return ImageFont.load_default()
+
+class AnnotationSprite:
+    """An annotation rasterized once: a cropped RGBA image and its top-left position in the frame."""
+    def __init__(self, rgba, x, y):
+        self.rgba, self.x, self.y = rgba, x, y
+
+def rasterize_annotation(event):
+    if event.get('type', 'pencil') == 'pencil':
+        width = event['width']
+        xs = [x for seg in event['segments'] for x in (seg[0], seg[2])]
+        ys = [y for seg in event['segments'] for y in (seg[1], seg[3])]
+        if not xs: return None
+        x0, y0 = math.floor(min(xs)) - width, math.floor(min(ys)) - width
+        x1, y1 = math.ceil(max(xs)) + width, math.ceil(max(ys)) + width
+        mask = Image.new("L", (x1 - x0 + 1, y1 - y0 + 1), 0)
+        draw = ImageDraw.Draw(mask)
+        # Integer shifts keep the rasterization identical to drawing in place
+        for seg_x1, seg_y1, seg_x2, seg_y2 in event['segments']:
+            draw.line((seg_x1 - x0, seg_y1 - y0, seg_x2 - x0, seg_y2 - y0), fill=255, width=width)
+    elif event.get('type') == 'text':
+        if not event['text']: return None
+        font = get_annotation_font(event['font_size'])
+        pos_x, pos_y = event['pos']
+        left, top, right, bottom = font.getbbox(event['text'], anchor="ls")
+        x0, y0 = math.floor(pos_x + left) - 1, math.floor(pos_y + top) - 1
+        x1, y1 = math.ceil(pos_x + right) + 1, math.ceil(pos_y + bottom) + 1
+        mask = Image.new("L", (x1 - x0 + 1, y1 - y0 + 1), 0)
+        ImageDraw.Draw(mask).text((pos_x - x0, pos_y - y0), event['text'], fill=255, font=font, anchor="ls")
+    else:
+        return None
+    alpha = np.asarray(mask)
+    rgba = np.empty(alpha.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = ImageColor.getrgb(event['color'])[:3]
+    rgba[..., 3] = alpha
+    return AnnotationSprite(rgba, x0, y0)
+
+def composite_sprites(frame, sprites):
+    """Alpha-composites sprites onto an RGB frame, only over their regions. The input frame is never modified."""
+    out = None
+    frame_height, frame_width = frame.shape[:2]
+    for sprite in sprites:
+        sprite_height, sprite_width = sprite.rgba.shape[:2]
+        fx0, fy0 = max(0, sprite.x), max(0, sprite.y)
+        fx1, fy1 = min(frame_width, sprite.x + sprite_width), min(frame_height, sprite.y + sprite_height)
+        if fx1 <= fx0 or fy1 <= fy0: continue
+        if out is None: out = frame[..., :3].copy()
+        region = out[fy0:fy1, fx0:fx1]
+        src = sprite.rgba[fy0 - sprite.y:fy1 - sprite.y, fx0 - sprite.x:fx1 - sprite.x]
+        alpha = src[..., 3:4].astype(np.uint16)
+        region[...] = (src[..., :3] * alpha + region * (255 - alpha) + 127) // 255
+    return frame if out is None else out
+
+class AnnotationIndex:
+    """Per-frame buckets of annotation events, so a frame only looks up the events that overlap it.
+    Each event is rasterized once into a sprite shared by every frame of its span."""
+    def __init__(self, events=()):
+        self.events = []
+        self._buckets = {}
+        self._sprites = {}
+        for event in events:
+            self.add(event)
+
+    def add(self, event):
+        self.events.append(event)
+        for frame_index in range(event.get('start_frame', 0), event.get('end_frame', 0)):
+            self._buckets.setdefault(frame_index, []).append(event)
+
+    def remove(self, event):
+        self.events = [e for e in self.events if e is not event]
+        for frame_index in range(event.get('start_frame', 0), event.get('end_frame', 0)):
+            bucket = [e for e in self._buckets.get(frame_index, ()) if e is not event]
+            if bucket: self._buckets[frame_index] = bucket
+            else: self._buckets.pop(frame_index, None)
+        self._sprites.pop(id(event), None)
+
+    def invalidate(self, event=None):
+        """Drops cached sprites after events were modified in place (crop offsets, colour)."""
+        if event is None: self._sprites.clear()
+        else: self._sprites.pop(id(event), None)
+
+    def events_at(self, frame_index):
+        return self._buckets.get(frame_index, ())
+
+    def sprites_at(self, frame_index):
+        sprites = []
+        for event in self.events_at(frame_index):
+            key = id(event)
+            if key not in self._sprites:
+                self._sprites[key] = rasterize_annotation(event)
+            if self._sprites[key] is not None:
+                sprites.append(self._sprites[key])
+        return sprites
+
+    def annotate(self, frame, frame_index):
+        return composite_sprites(frame, self.sprites_at(frame_index))
+
+
+# --- Edits files ---
+# JSON description of an edit, shared by the batch exporter and saved editor sessions:
+#   "entries":     [[source frame, duration ms], ...]  full edit list (optional, defaults to every frame)
+#   "trim":        [start, stop]                       slice of that list, stop may be null or negative
+#   "crop":        [x1, y1, x2, y2]                    in source frame coordinates
+#   "annotations": [event, ...]                        editor events, in trimmed timeline indices and cropped coordinates
+EDITS_FILE_NAME = 'edits.json'
+
+def edits_path(source_path):
+    """Where the edits of a project folder or GIF file live: inside the folder, or next to the file."""
+    if os.path.isdir(source_path): return os.path.join(source_path, EDITS_FILE_NAME)
+    return source_path + '.' + EDITS_FILE_NAME
+
+def load_edits(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    # Written aside then swapped in, a crash never leaves half a file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def save_edits(path, edits):
+    _write_json(path, edits)
+
+def timeline_from_edits(store, edits):
+    """Timeline and annotation events described by an edits dict."""
+    timeline = Timeline(store)
+    if edits.get('entries') is not None:
+        timeline.entries = [TimelineEntry(int(source), int(duration)) for source, duration in edits['entries']]
+        if any(not 0 <= entry.source < len(store) for entry in timeline.entries):
+            raise ValueError("The edits refer to frames missing from the source.")
+    if edits.get('trim'):
+        start, stop = edits['trim']
+        timeline.entries = timeline.entries[slice(start, stop)]
+    if edits.get('crop'):
+        timeline.crop = tuple(int(v) for v in edits['crop'])
+    return timeline, [dict(event) for event in edits.get('annotations', ())]
+
+def edits_from_timeline(timeline, events):
+    """Inverse of timeline_from_edits(), for saving the editor state."""
+    return {'entries': [list(entry) for entry in timeline.entries],
+            'crop': list(timeline.crop) if timeline.crop else None,
+            'annotations': list(events)}
+
+
+# --- Export cache ---
+EXPORT_CACHE_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or tempfile.gettempdir(), "Gif Recorder", "export_cache")
+EXPORT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+EXPORT_CACHE_VERSION = 1 # Bump when an encoder change makes old outputs stale
+
+def clip_digest(timeline, annotation_index):
+    """Content hash of what an export shows: source frames, timing, crop and annotations."""
+    digest = hashlib.sha256()
+    for entry in timeline.entries:
+        digest.update(f"{timeline.store.source_digest(entry.source)}/{entry.duration};".encode())
+    events = sorted(json.dumps(event, sort_keys=True) for event in annotation_index.events)
+    digest.update(json.dumps([timeline.crop, events]).encode())
+    return digest.hexdigest()
+
+class ExportCache:
+    """Content-addressed store of encoded exports, evicted least recently used first above max_bytes.
+    An entry is a <key><extension> file and a <key>.json report; the mtime of the report is its last use."""
+    def __init__(self, folder=EXPORT_CACHE_DIR, max_bytes=EXPORT_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps([EXPORT_CACHE_VERSION, *parts], sort_keys=True).encode()).hexdigest()
+
+    def _paths(self, key, extension):
+        return os.path.join(self.folder, key + extension), os.path.join(self.folder, key + '.json')
+
+    def fetch(self, key, destination):
+        """Copies a cached output to destination and returns its report, or None on a miss."""
+        data_path, info_path = self._paths(key, os.path.splitext(destination)[1])
+        try:
+            with open(info_path, encoding='utf-8') as f:
+                info = json.load(f)
+            shutil.copyfile(data_path, destination)
+            os.utime(info_path)
+        except (OSError, ValueError):
+            return None
+        return info
+
+    def store(self, key, path, info):
+        # The cache only saves time: a full or unwritable folder must not fail the export that was just encoded
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            data_path, info_path = self._paths(key, os.path.splitext(path)[1])
+            shutil.copyfile(path, data_path + '.tmp')
+            os.replace(data_path + '.tmp', data_path)
+            _write_json(info_path, info)
+        except OSError as e:
+            print(f"DEBUG: Export cache not updated: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        entries = {}
+        try: names = os.listdir(self.folder)
+        except OSError as e:
+            print(f"DEBUG: Export cache not evicted: {e}")
+            return
+        for name in names:
+            path = os.path.join(self.folder, name)
+            key = name.split('.', 1)[0]
+            try: stat = os.stat(path)
+            except OSError: continue
+            size, last_use, paths = entries.get(key, (0, 0, []))
+            last_use = max(last_use, stat.st_mtime) if name.endswith('.json') else last_use
+            entries[key] = (size + stat.st_size, last_use, paths + [path])
+        total = sum(size for size, _, _ in entries.values())
+        for size, _, paths in sorted(entries.values(), key=lambda entry: entry[1]):
+            if total <= self.max_bytes: break
+            for path in paths:
+                try: os.remove(path)
+                except OSError: pass
+            total -= size
+
+
+# --- Export Pipeline ---
+EXPORT_QUEUE_SIZE = 4 # Frames buffered between two pipeline stages
+
+class ExportCancelled(Exception):
+    pass
+
+class _StageEnd:
+    def __init__(self, error=None):
+        self.error = error
+
+def run_stage(items, cancel_event, maxsize=EXPORT_QUEUE_SIZE):
+    """Iterates items on a dedicated thread and hands them over through a bounded queue."""
+    handoff = queue.Queue(maxsize)
+
+    def put(item):
+        while not cancel_event.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in items:
+                if not put(item): return
+            put(_StageEnd())
+        except BaseException as e:
+            put(_StageEnd(e))
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        try:
+            item = handoff.get(timeout=0.1)
+        except queue.Empty:
+            if cancel_event.is_set(): raise ExportCancelled()
+            continue
+        if isinstance(item, _StageEnd):
+            if item.error: raise item.error
+            return
+        yield item
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk: return
+        yield chunk
+
+def flatten_frame(frame):
+    return np.ascontiguousarray(frame[..., :3], dtype=np.uint8)
+
+def scale_frame(frame, scale):
+    height, width = frame.shape[:2]
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return np.array(Image.fromarray(frame).resize(size, Image.LANCZOS))
+
+def even_frame(frame, mode='crop'):
+    """Video encoding needs even dimensions: drops or repeats the last row/column instead of resampling."""
+    height, width = frame.shape[:2]
+    if not (width % 2 or height % 2): return frame
+    if mode == 'pad':
+        return np.pad(frame, ((0, height % 2), (0, width % 2), (0, 0)), mode='edge')
+    return frame[:height - height % 2, :width - width % 2]
+
+def export_stream(timeline, annotation_index, cancel_event, kept=None, transform=None, workers=EXPORT_WORKERS, fold=None):
+    """decode -> annotate/flatten/transform -> [fold duplicates] -> encoder. Yields (RGB frame, duration ms).
+    The middle stage fans out over `workers` threads in ordered chunks. `kept` holds the
+    (index, duration) pairs from retime_for_fps, so dropped frames are never decoded.
+    `fold` is an optional DuplicateFolder."""
+    if kept is None: kept = list(enumerate(timeline.durations()))
+    source = run_stage(zip(kept, timeline.iter_frames([index for index, _ in kept])), cancel_event)
+
+    def process(chunk):
+        processed = []
+        for (index, duration), frame in chunk:
+            frame = flatten_frame(annotation_index.annotate(frame, index))
+            if transform: frame = transform(frame)
+            processed.append((frame, duration))
+        return processed
+
+    chunks = imap_ordered(process, _chunks(source, EXPORT_CHUNK_SIZE), workers)
+    frames = (item for chunk in chunks for item in chunk)
+    return run_stage(fold.fold(frames) if fold else frames, cancel_event)
+
+class ExportJob:
+    """Runs an export function on a worker thread. The GUI polls done/total and may cancel."""
+    def __init__(self, work, total, stage="Export"):
+        self._work = work
+        self.total, self.done, self.stage = total, 0, stage
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self.result, self.error = None, None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try: self.result = self._work(self)
+        except BaseException as e:
+            self.error = e
+            self.cancel_event.set() # Stops the upstream stages still waiting on their queues
+        finally: self.finished.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def advance(self, count=1):
+        if self.cancel_event.is_set(): raise ExportCancelled()
+        self.done += count
+
+class _FanOutSink:
+    """One encoder fed from a shared frame stream through its own bounded queue and thread."""
+    _END = object()
+
+    def __init__(self, consume, cancel_event):
+        self.queue = queue.Queue(EXPORT_QUEUE_SIZE)
+        self.cancel_event = cancel_event
+        self.result, self.error = None, None
+        self.done = threading.Event()
+        threading.Thread(target=self._run, args=(consume,), daemon=True).start()
+
+    def _frames(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.cancel_event.is_set(): raise ExportCancelled()
+                continue
+            if item is self._END: return
+            yield item
+
+    def _run(self, consume):
+        try: self.result = consume(self._frames())
+        except BaseException as e: self.error = e
+        finally: self.done.set()
+
+    def put(self, item):
+        # Encoders that stopped early (poster frame, failure) are skipped
+        while not (self.done.is_set() or self.cancel_event.is_set()):
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        self.put(self._END)
+
+def fan_out(items, consumers, job):
+    """Feeds one stream to several encoders running at the same time.
+    Returns {name: (result, error)}; a failing encoder does not stop the others."""
+    sinks = {name: _FanOutSink(consume, job.cancel_event) for name, consume in consumers.items()}
+    try:
+        for item in items:
+            for sink in sinks.values(): sink.put(item)
+            job.advance()
+    finally:
+        for sink in sinks.values(): sink.close()
+    for sink in sinks.values():
+        while not sink.done.wait(0.1):
+            if job.cancel_event.is_set(): raise ExportCancelled()
+    if job.cancel_event.is_set(): raise ExportCancelled()
+    return {name: (sink.result, sink.error) for name, sink in sinks.items()}
+
+
+# --- Encoders ---
+def clip_palette(timeline, annotation_index, cancel_event, kept=None, transform=None, colors=255, samples=PALETTE_SAMPLE_FRAMES):
+    """Global GIF palette built from frames spread evenly over the export."""
+    if kept is None: kept = list(enumerate(timeline.durations()))
+    step = max(1, len(kept) // samples)
+    frames = [frame for frame, _ in export_stream(timeline, annotation_index, cancel_event, kept[::step], transform)]
+    return median_cut_palette(sample_pixels(frames), colors)
+
+def _write_animation(encoder_class, path, frames, job, options):
+    """Streams (frame, duration) pairs into one of the gif_encoders writers. Returns its size report."""
+    with encoder_class(path, **options) as encoder:
+        for frame, duration in frames:
+            encoder.add_frame(frame, duration)
+            if job: job.advance()
+    if not encoder.frame_sizes:
+        os.remove(path)
+        raise ValueError("Aucune image à sauvegarder.")
+    return encoder.report()
+
+def write_gif(path, frames, job=None, **options):
+    return _write_animation(GifEncoder, path, frames, job, options)
+
+def write_apng(path, frames, job=None, **options):
+    return _write_animation(ApngEncoder, path, frames, job, options)
+
+def write_webp(path, frames, job=None, **options):
+    return _write_animation(WebpEncoder, path, frames, job, options)
+
+def write_poster(path, frames):
+    """Saves the first frame of the stream as a still image."""
+    for frame, _ in frames:
+        Image.fromarray(frame).save(path)
+        return path
+    raise ValueError("Aucune image à sauvegarder.")
+
+WebmSettings = namedtuple('WebmSettings', ['codec', 'crf', 'cpu_used', 'deadline', 'threads', 'row_mt', 'even_mode'])
+DEFAULT_WEBM_SETTINGS = WebmSettings('vp9', 32, 4, 'good', os.cpu_count() or 1, True, 'crop')
+WEBM_CODECS = {'vp8': 'libvpx', 'vp9': 'libvpx-vp9'}
+WEBM_DEADLINES = ('realtime', 'good', 'best')
+VP8_MAX_BITRATE = '8M' # libvpx (VP8) only honours -crf under a bitrate cap
+
+def webm_output_params(settings):
+    params = ['-crf', str(settings.crf), '-b:v', VP8_MAX_BITRATE if settings.codec == 'vp8' else '0',
+              '-deadline', settings.deadline, '-cpu-used', str(settings.cpu_used), '-threads', str(settings.threads)]
+    if settings.codec == 'vp9' and settings.row_mt:
+        params += ['-row-mt', '1']
+    return params
+
+def write_webm(path, frames, fps, job=None, settings=DEFAULT_WEBM_SETTINGS):
+    """Pipes (frame, duration) pairs into ffmpeg one frame at a time, at a constant frame rate."""
+    import imageio_ffmpeg
+
+    def prepared():
+        for frame, duration in frames:
+            if job: job.advance()
+            yield np.ascontiguousarray(even_frame(frame, settings.even_mode)), duration
+
+    writer = None
+    try:
+        for frame in to_constant_rate(prepared(), fps):
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = imageio_ffmpeg.write_frames(path, (width, height), fps=fps, codec=WEBM_CODECS[settings.codec],
+                                                     pix_fmt_out='yuv420p', quality=None, macro_block_size=1,
+                                                     output_params=webm_output_params(settings))
+                writer.send(None) # Starts ffmpeg
+            writer.send(frame)
+    finally:
+        if writer is not None: writer.close()
+    if writer is None:
+        raise ValueError("Aucune image à sauvegarder.")
+    return path
+
+
+# --- Size-Targeted GIF ---
+GifSettings = namedtuple('GifSettings', ['scale', 'fps', 'colors', 'lossy']) # fps None keeps the edited timing
+FULL_QUALITY_GIF = GifSettings(1.0, None, 255, 0)
+# Ordered from best to smallest; each rung is expected to encode smaller than the previous one
+GIF_SIZE_LADDER = [
+    FULL_QUALITY_GIF,
+    GifSettings(1.0, None, 255, 4),
+    GifSettings(1.0, 15, 255, 6),
+    GifSettings(0.9, 15, 255, 8),
+    GifSettings(0.8, 15, 192, 8),
+    GifSettings(0.7, 12, 128, 10),
+    GifSettings(0.6, 12, 128, 12),
+    GifSettings(0.5, 10, 96, 16),
+    GifSettings(0.4, 10, 64, 20),
+    GifSettings(0.3, 8, 48, 24),
+]
+SIZE_ESTIMATE_WINDOWS = 4 # Short runs of consecutive frames encoded to estimate a whole clip
+SIZE_ESTIMATE_WINDOW_FRAMES = 5
+
+def gif_stream_options(timeline, settings):
+    """kept/transform arguments of export_stream() for a GifSettings."""
+    durations = timeline.durations()
+    kept = retime_for_fps(durations, settings.fps) if settings.fps else list(enumerate(durations))
+    transform = partial(scale_frame, scale=settings.scale) if settings.scale != 1.0 else None
+    return kept, transform
+
+def export_gif(path, timeline, annotation_index, job, settings=FULL_QUALITY_GIF, fold_threshold=None):
+    kept, transform = gif_stream_options(timeline, settings)
+    palette = clip_palette(timeline, annotation_index, job.cancel_event, kept, transform, settings.colors)
+    job.total, job.done = len(kept), 0
+    fold = DuplicateFolder(fold_threshold, job) if fold_threshold is not None else None
+    frames = export_stream(timeline, annotation_index, job.cancel_event, kept, transform, fold=fold)
+    report = write_gif(path, frames, job, palette=palette, lossy=settings.lossy)
+    report['folded_frames'] = fold.folded_frames if fold else 0
+    return report
+
+class GifSizeEstimator:
+    """Predicts the encoded size of a GifSettings by encoding a few short windows of the clip.
+    The first frame of a window costs a full keyframe, the others only their deltas."""
+    def __init__(self, timeline, annotation_index, cancel_event, fold_threshold=None):
+        self.timeline = timeline
+        self.annotation_index = annotation_index
+        self.cancel_event = cancel_event
+        self.fold_threshold = fold_threshold
+        self._frames = {} # Annotated full-size frames, shared by every settings tried
+
+    def _frame(self, index):
+        if index not in self._frames:
+            if self.cancel_event.is_set(): raise ExportCancelled()
+            frame = self.timeline.frame(index)
+            self._frames[index] = flatten_frame(self.annotation_index.annotate(frame, index))
+        return self._frames[index]
+
+    def _windows(self, kept):
+        size = min(SIZE_ESTIMATE_WINDOW_FRAMES, len(kept))
+        starts = np.linspace(0, len(kept) - size, min(SIZE_ESTIMATE_WINDOWS, len(kept) - size + 1)).astype(int)
+        return [kept[start:start + size] for start in sorted(set(starts))]
+
+    def estimate(self, settings):
+        kept, transform = gif_stream_options(self.timeline, settings)
+        if not kept: return 0
+        windows = [[((transform or (lambda f: f))(self._frame(index)), duration) for index, duration in window]
+                   for window in self._windows(kept)]
+        palette = median_cut_palette(sample_pixels([frame for window in windows for frame, _ in window]), settings.colors)
+        keyframe_bytes, delta_bytes, delta_count = [], 0, 0
+        for window in windows:
+            if self.fold_threshold is not None:
+                window_frames = list(DuplicateFolder(self.fold_threshold).fold(window))
+            else:
+                window_frames = window
+            with GifEncoder(io.BytesIO(), palette=palette, lossy=settings.lossy) as encoder:
+                for frame, duration in window_frames:
+                    encoder.add_frame(frame, duration)
+                encoder.close()
+            keyframe_bytes.append(encoder.frame_sizes[0])
+            delta_bytes += sum(encoder.frame_sizes[1:])
+            delta_count += len(window) - 1 # Folded and merged duplicates count as free frames
+        header_bytes = encoder.bytes_written - sum(encoder.frame_sizes)
+        per_delta = delta_bytes / delta_count if delta_count else 0
+        return int(header_bytes + np.mean(keyframe_bytes) + per_delta * (len(kept) - 1))
+
+def choose_gif_settings(estimator, target_bytes, ladder=GIF_SIZE_LADDER):
+    """Best rung of the ladder whose estimate fits the budget (binary search, sizes decrease down the ladder)."""
+    low, high = 0, len(ladder) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if estimator.estimate(ladder[middle]) <= target_bytes: high = middle
+        else: low = middle + 1
+    return low
+
+def export_gif_to_size(path, timeline, annotation_index, job, target_bytes, ladder=GIF_SIZE_LADDER, fold_threshold=None):
+    """Encodes once with the estimated settings; steps down the ladder only if the real file is still too big."""
+    job.stage = "Estimation"
+    estimator = GifSizeEstimator(timeline, annotation_index, job.cancel_event, fold_threshold)
+    rung = choose_gif_settings(estimator, target_bytes, ladder)
+    while True:
+        job.stage = "Compression"
+        report = export_gif(path, timeline, annotation_index, job, ladder[rung], fold_threshold)
+        if report['bytes'] <= target_bytes or rung == len(ladder) - 1:
+            return report, ladder[rung]
+        rung += 1
+
+
+# --- Multi-Variant Export ---
+def export_variants(timeline, annotation_index, job, outputs, target_bytes, webm_fps=1000 // FRAME_DURATION_MS,
+                    webm_settings=DEFAULT_WEBM_SETTINGS, fold_threshold=None, cache=None):
+    """Decodes and annotates the clip once and feeds every requested encoder from that single pass.
+    outputs maps 'gif', 'gif_small', 'webm' and 'poster' to paths. Returns {name: {'path', 'bytes',
+    'folded_frames'}} for the files written and {name: {'error'}} for optional outputs that failed.
+    When the full-size GIF is already expected to fit target_bytes, 'gif_small' is that same GIF
+    and its result is flagged 'full_quality'.
+    With an ExportCache, outputs whose clip and settings were already encoded are copied from it
+    and only the others are encoded."""
+    results, keys = {}, {}
+    if cache:
+        job.stage = "Cache"
+        clip = clip_digest(timeline, annotation_index)
+        settings = {'gif': [fold_threshold], 'gif_small': [target_bytes, fold_threshold],
+                    'webm': [webm_fps, list(webm_settings), fold_threshold], 'poster': []}
+        for name, path in outputs.items():
+            keys[name] = cache.key(clip, name, settings[name])
+            info = cache.fetch(keys[name], path)
+            if info is not None: results[name] = dict(info, path=path, cached=True)
+        outputs = {name: path for name, path in outputs.items() if name not in results}
+        if not outputs: return results
+
+    cancel_event = job.cancel_event
+    everything = list(enumerate(timeline.durations()))
+    job.stage = "Palette"
+    step = max(1, len(everything) // PALETTE_SAMPLE_FRAMES)
+    samples = [frame for frame, _ in export_stream(timeline, annotation_index, cancel_event, everything[::step])]
+
+    consumers = {}
+    if 'gif' in outputs:
+        palette = median_cut_palette(sample_pixels(samples))
+        consumers['gif'] = lambda frames: write_gif(outputs['gif'], frames, palette=palette)
+    rung = 0
+    if 'gif_small' in outputs:
+        job.stage = "Estimation"
+        rung = choose_gif_settings(GifSizeEstimator(timeline, annotation_index, cancel_event, fold_threshold), target_bytes)
+    if rung > 0:
+        settings = GIF_SIZE_LADDER[rung]
+        transform = partial(scale_frame, scale=settings.scale) if settings.scale != 1.0 else (lambda frame: frame)
+        small_palette = median_cut_palette(sample_pixels([transform(frame) for frame in samples]), settings.colors)
+        def write_small(frames):
+            if settings.fps: frames = retime_frames(frames, settings.fps)
+            return write_gif(outputs['gif_small'], ((transform(frame), duration) for frame, duration in frames),
+                             palette=small_palette, lossy=settings.lossy)
+        consumers['gif_small'] = write_small
+    elif 'gif_small' in outputs and 'gif' not in outputs:
+        palette = median_cut_palette(sample_pixels(samples))
+        consumers['gif_small'] = lambda frames: write_gif(outputs['gif_small'], frames, palette=palette)
+    if 'webm' in outputs:
+        consumers['webm'] = lambda frames: write_webm(outputs['webm'], frames, webm_fps, settings=webm_settings)
+    if 'poster' in outputs:
+        consumers['poster'] = lambda frames: write_poster(outputs['poster'], frames)
+
+    job.stage, job.total, job.done = "Encodage", len(everything), 0
+    fold = DuplicateFolder(fold_threshold, job) if fold_threshold is not None else None
+    for name, (_, error) in fan_out(export_stream(timeline, annotation_index, cancel_event, fold=fold), consumers, job).items():
+        if error is not None:
+            if name == 'gif': raise error
+            if os.path.exists(outputs[name]): os.remove(outputs[name])
+            results[name] = {'error': error}
+        else:
+            results[name] = {'path': outputs[name], 'bytes': os.path.getsize(outputs[name]),
+                             'folded_frames': fold.folded_frames if fold else 0}
+    if 'gif_small' in outputs and rung == 0:
+        # Fits at full quality: the small variant is the full GIF, copied rather than encoded twice
+        if 'gif' in outputs:
+            shutil.copyfile(outputs['gif'], outputs['gif_small'])
+            results['gif_small'] = dict(results['gif'], path=outputs['gif_small'])
+        if 'bytes' in results.get('gif_small', {}): results['gif_small']['full_quality'] = True
+
+    small = results.get('gif_small')
+    if small and 'bytes' in small and small['bytes'] > target_bytes and rung < len(GIF_SIZE_LADDER) - 1:
+        # The estimate was optimistic: only this output gets a second pass
+        report, _ = export_gif_to_size(outputs['gif_small'], timeline, annotation_index, job, target_bytes,
+                                       GIF_SIZE_LADDER[rung + 1:], fold_threshold)
+        results['gif_small'] = {'path': outputs['gif_small'], 'bytes': report['bytes'], 'folded_frames': report['folded_frames']}
+
+    for name in outputs:
+        if cache and 'bytes' in results.get(name, {}):
+            cache.store(keys[name], outputs[name], {key: results[name][key] for key in ('bytes', 'folded_frames', 'full_quality') if key in results[name]})
+    return results
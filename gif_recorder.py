@@ -1,14 +1,11 @@
+import gif_startup # First: starts the --profile-startup clock
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import ImageTk, Image, ImageDraw, ImageFont
+from PIL import ImageTk, Image
 import threading
 import time
 import os
 import tempfile
-import imageio.v2 as imageio
-import numpy as np
-import dxcam
-from pynput import keyboard, mouse
 from pystray import Icon, Menu, MenuItem
 import sys
 import subprocess
@@ -19,7 +16,9 @@ import queue
 from datetime import datetime
 import shutil
 import traceback
-import psutil
+from multiprocessing.connection import Client
+# imageio, dxcam, pynput and psutil are imported where they are first used, off the startup path
+gif_startup.mark("imports")
 
 # --- Configuration ---
 DEFAULT_RECORD_DURATION = 20
@@ -299,6 +298,8 @@ def prompt_to_start_autowatch(exe_name):
 def autowatch_thread_func():
     """The main thread for monitoring processes and handling autowatch logic."""
     global autowatch_last_prompt, autowatch_capture_in_progress, autowatch_is_available
+    import psutil
+    from pynput import keyboard, mouse
     
     PYNPUT_SPECIAL_KEY_MAP = {
         'enter': keyboard.Key.enter, 'space': keyboard.Key.space,
@@ -447,9 +448,10 @@ def _process_autowatch_capture(rule):
             project_full_path = os.path.join(projects_path, proj_dir_name)
             os.makedirs(project_full_path, exist_ok=True)
             
+            import imageio.v2 as imageio
             for i, frame in enumerate(frames_to_save):
                 frame_path = os.path.join(project_full_path, f"{i:04d}.jpg")
-                rgb_frame = frame[..., ::-1]
+                rgb_frame = frame_to_rgb(frame)
                 imageio.imwrite(frame_path, rgb_frame)
         except Exception as e:
             traceback.print_exc()
@@ -477,6 +479,7 @@ def update_aw_indicator_gui():
         is_capturing = any(autowatch_capture_in_progress.values()) or manual_capture_in_progress
 
         if capture_mode == 'autowatch':
+            import psutil
             active_kpm_rule_found = False
             for rule in autowatch_rules:
                 rule_exe = os.path.basename(rule['exe']).lower()
@@ -519,6 +522,94 @@ def update_aw_indicator_gui():
     except Exception as e:
         print(f"Error updating AW indicator: {e}")
 
+# --- Batch Export Queue ---
+BATCH_EXPORT_PROCESSES = 2 # Headless exports running at once, the others wait their turn
+BATCH_EXPORT_FORMATS = "gif"
+BATCH_EXPORT_POLL_MS = 500
+
+class BatchExportQueue:
+    """Exports projects with headless editor processes (gif_editor --batch), at most max_running at a time.
+    Lives outside the gallery so exports go on after it is closed and while recording."""
+    def __init__(self, max_running=BATCH_EXPORT_PROCESSES):
+        self.max_running = max_running
+        self.jobs = {} # project path -> {'state': queued/running/done/error, 'stage', 'done', 'total', 'bytes', 'error'}
+        self._pending = deque()
+        self._running = {} # project path -> (Popen, progress file, report file)
+        self._polling = False
+
+    def is_active(self, project_path):
+        return self.jobs.get(project_path, {}).get('state') in ('queued', 'running')
+
+    def submit(self, project_path):
+        if self.is_active(project_path): return
+        self.jobs[project_path] = {'state': 'queued'}
+        self._pending.append(project_path)
+        if not self._polling:
+            self._polling = True
+            root_for_windows.after(0, self._poll)
+
+    def _start(self, project_path):
+        base = os.path.join(tempfile.gettempdir(), f"gif_batch_{os.getpid()}_{int(time.time() * 1000)}_{len(self._running)}")
+        progress_path, report_path = base + "_progress.json", base + "_report.json"
+        command = get_editor_command() + ['--batch', project_path, '-o', project_path, '-f', BATCH_EXPORT_FORMATS, '-j', '1',
+                                          '--progress', progress_path, '--report', report_path]
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                       creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except Exception as e:
+            self.jobs[project_path] = {'state': 'error', 'error': str(e)}
+            return
+        try:
+            # Exports must not steal CPU time from the capture loop
+            import psutil
+            psutil.Process(process.pid).nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if sys.platform == 'win32' else 10)
+        except Exception: pass
+        self.jobs[project_path] = {'state': 'running'}
+        self._running[project_path] = (process, progress_path, report_path)
+
+    def _finish(self, process, progress_path, report_path):
+        try:
+            with open(report_path, encoding='utf-8') as f:
+                report = json.load(f)['reports'][0]
+        except (OSError, ValueError, KeyError, IndexError):
+            report = {'error': f"Export interrompu (code {process.returncode})"}
+        for path in (progress_path, report_path):
+            if os.path.exists(path): os.remove(path)
+        if 'error' in report:
+            return {'state': 'error', 'error': report['error']}
+        outputs = report.get('outputs', {})
+        return {'state': 'done', 'bytes': sum(output.get('bytes', 0) for output in outputs.values()),
+                'paths': [output['path'] for output in outputs.values() if 'path' in output]}
+
+    def _poll(self):
+        for project_path, (process, progress_path, report_path) in list(self._running.items()):
+            if process.poll() is None:
+                try:
+                    with open(progress_path, encoding='utf-8') as f:
+                        self.jobs[project_path].update(json.load(f))
+                except (OSError, ValueError): pass
+                continue
+            del self._running[project_path]
+            self.jobs[project_path] = self._finish(process, progress_path, report_path)
+        while self._pending and len(self._running) < self.max_running:
+            self._start(self._pending.popleft())
+        if self._running or self._pending:
+            root_for_windows.after(BATCH_EXPORT_POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+batch_export_queue = BatchExportQueue()
+
+def format_export_status(status):
+    state = status.get('state')
+    if state == 'queued': return "En attente"
+    if state == 'running':
+        if not status.get('total'): return "Démarrage..."
+        return f"{status.get('stage', 'Export')}: {100 * status.get('done', 0) // status['total']}%"
+    if state == 'done': return f"Exporté ({status['bytes'] / (1024 * 1024):.1f} Mo)"
+    if state == 'error': return f"Erreur: {status['error']}"[:60]
+    return ""
+
 # --- Project Gallery Window (Dark Theme) ---
 class ProjectGalleryWindow(tk.Toplevel):
     def __init__(self, master):
@@ -528,6 +619,12 @@ class ProjectGalleryWindow(tk.Toplevel):
         self.config(bg="#2E2E2E")
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         set_dark_title_bar(self)
+        self.selection = {} # project path -> BooleanVar of its tile checkbox
+        self.status_labels = {} # project path -> export status label of its tile
+        toolbar = tk.Frame(self, bg="#2E2E2E")
+        toolbar.pack(fill=tk.X, padx=10, pady=(10, 0))
+        tk.Button(toolbar, text="Exporter la sélection", command=self.export_selected, fg="white", bg="#28a745", relief=tk.FLAT).pack(side=tk.LEFT)
+        tk.Button(toolbar, text="Tout sélectionner", command=self.toggle_select_all, fg="white", bg="#4E4E4E", relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
         self.main_frame = tk.Frame(self, bg="#2E2E2E")
         self.main_frame.pack(fill=tk.BOTH, expand=True)
         self.canvas = tk.Canvas(self.main_frame, bg="#1E1E1E", highlightthickness=0)
@@ -539,6 +636,7 @@ class ProjectGalleryWindow(tk.Toplevel):
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10,0), pady=10)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0,10), pady=10)
         self.refresh_projects()
+        self.update_export_status()
 
     def on_close(self):
         global gallery_window
@@ -548,6 +646,7 @@ class ProjectGalleryWindow(tk.Toplevel):
     def refresh_projects(self):
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self.selection, self.status_labels = {}, {}
         if not projects_path or not os.path.exists(projects_path):
             tk.Label(self.scrollable_frame, text="Project folder not found or not set.", bg="#1E1E1E", fg="white").pack(pady=20)
             return
@@ -589,11 +688,42 @@ class ProjectGalleryWindow(tk.Toplevel):
         info_frame = tk.Frame(frame, bg="#4E4E4E")
         info_frame.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=10)
         tk.Label(info_frame, text=folder_name, font=("Arial", 12, "bold"), bg="#4E4E4E", fg="white").pack(anchor="w")
+        selected = tk.BooleanVar(value=False)
+        tk.Checkbutton(info_frame, text="Sélectionner", variable=selected, bg="#4E4E4E", fg="white", selectcolor="#2E2E2E",
+                       activebackground="#4E4E4E", activeforeground="white").pack(anchor="w")
+        self.selection[project_full_path] = selected
         delete_button = tk.Button(info_frame, text="Delete", command=lambda p=project_full_path: self.delete_project(p), fg="white", bg="#dc3545", relief=tk.FLAT)
         delete_button.pack(anchor="w", pady=5)
+        status_label = tk.Label(info_frame, text=format_export_status(batch_export_queue.jobs.get(project_full_path, {})),
+                                bg="#4E4E4E", fg="#CCCCCC", font=("Arial", 9))
+        status_label.pack(anchor="w")
+        self.status_labels[project_full_path] = status_label
         return frame
 
+    def toggle_select_all(self):
+        select = not all(var.get() for var in self.selection.values())
+        for var in self.selection.values(): var.set(select)
+
+    def export_selected(self):
+        selected = [path for path, var in self.selection.items() if var.get()]
+        if not selected:
+            messagebox.showinfo("Aucun projet", "Cochez les projets à exporter.", parent=self)
+            return
+        for path in selected:
+            batch_export_queue.submit(path)
+            self.selection[path].set(False)
+        self.update_export_status(reschedule=False)
+
+    def update_export_status(self, reschedule=True):
+        if not self.winfo_exists(): return
+        for path, label in self.status_labels.items():
+            label.config(text=format_export_status(batch_export_queue.jobs.get(path, {})))
+        if reschedule: self.after(BATCH_EXPORT_POLL_MS, self.update_export_status)
+
     def delete_project(self, project_path):
+        if batch_export_queue.is_active(project_path):
+            messagebox.showwarning("Export en cours", "Ce projet est en cours d'export, réessayez une fois l'export terminé.", parent=self)
+            return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to permanently delete this project?\n{project_path}"):
             try:
                 shutil.rmtree(project_path)
@@ -607,7 +737,7 @@ class ProjectGalleryWindow(tk.Toplevel):
     def open_project_in_editor(self, project_path):
         print(f"Opening project folder in editor: {project_path}")
         try:
-            subprocess.Popen(get_editor_command() + [project_path])
+            launch_editor(project_path)
         except Exception as e:
             print(f"ERROR: Error launching Gif Editor with project folder: {e}")
             messagebox.showerror("Error", f"Could not open project in editor: {e}")
@@ -702,7 +832,9 @@ def display_splash_screen_gui():
 
 # --- Core Logic ---
 def setup_dxcam():
+    """Runs on the capture thread: importing dxcam and opening the output takes a while, the UI is already up."""
     global camera, selected_monitor_index
+    import dxcam
     try:
         print(f"Initializing DXCam on monitor {selected_monitor_index}...")
         camera = dxcam.create(output_idx=selected_monitor_index, output_color="BGR")
@@ -716,14 +848,73 @@ def setup_dxcam():
                 print("DXCam initialized on primary monitor.")
             except Exception as e2:
                 print(f"Fatal error: Could not initialize DXCam on primary monitor either: {e2}")
-                exit()
+                exit_application()
         else:
             print(f"Fatal error: Could not initialize DXCam: {e}")
-            exit()
+            exit_application()
+
+# --- Compact Replay Buffer ---
+# Frames are kept as planar YUV 4:2:0 (1.5 bytes per pixel) instead of dxcam's BGR (3 bytes per pixel).
+# They are converted on ingest, and back to RGB only for the frames that are saved.
+YUV_CONVERT_WORKERS = min(4, os.cpu_count() or 1) # One core converts 1080p in ~25 ms, 4K in ~100 ms: above the 50 ms frame budget
+YUV_MAX_BACKLOG_S = 1 # Captured time waiting for conversion before compact mode is turned off for the session
+compact_buffer = False
+
+class Yuv420Converter:
+    """Converts captured frames on a thread pool so the capture loop keeps its frame rate.
+    Frames reach frames_buffer in capture order, with their capture time."""
+    def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from gif_engine import bgr_to_yuv420 # Imported by the capture thread, off the startup path
+        self._convert = bgr_to_yuv420
+        self._pool = ThreadPoolExecutor(YUV_CONVERT_WORKERS, thread_name_prefix="yuv420")
+        self._pending = deque() # (future, capture time), oldest first
+
+    def submit(self, frame, timestamp):
+        self._pending.append((self._pool.submit(self._convert, frame), timestamp))
+
+    def flush(self, wait=False):
+        """Appends the converted frames at the head of the queue to frames_buffer. Returns how many are still waiting."""
+        while self._pending and (wait or self._pending[0][0].done()):
+            future, timestamp = self._pending.popleft()
+            try: frame = future.result()
+            except Exception as e: print(f"Error converting frame to YUV: {e}"); continue
+            with buffer_lock: frames_buffer.append((frame, timestamp))
+        return len(self._pending)
+
+def frame_to_rgb(frame):
+    """RGB array of a buffered frame, whatever its storage."""
+    from gif_engine import Yuv420Frame, yuv420_to_rgb
+    return yuv420_to_rgb(frame) if isinstance(frame, Yuv420Frame) else frame[..., ::-1]
+
+def crop_buffered_frame(frame, x1, y1, x2, y2):
+    """Region of a buffered frame, None when it is empty. YUV frames are cropped to even coordinates."""
+    from gif_engine import Yuv420Frame, crop_yuv420
+    if isinstance(frame, Yuv420Frame): return crop_yuv420(frame, x1, y1, x2, y2)
+    h, w, _ = frame.shape
+    cx1, cy1, cx2, cy2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+    if (cy2 - cy1) > 0 and (cx2 - cx1) > 0: return frame[cy1:cy2, cx1:cx2]
+    return None
+
+def restore_bgr_buffer():
+    """Converts the YUV frames of the replay buffer back to BGR, once compact mode was turned off during a capture."""
+    global frames_buffer
+    from gif_engine import Yuv420Frame, yuv420_to_rgb
+    with buffer_lock: compact = [(frame, timestamp) for frame, timestamp in frames_buffer if isinstance(frame, Yuv420Frame)]
+    converted = {timestamp: yuv420_to_rgb(frame)[..., ::-1] for frame, timestamp in compact}
+    # Frames captured meanwhile were appended as BGR, only the converted ones are swapped
+    with buffer_lock: frames_buffer = deque(((converted.get(timestamp, frame), timestamp) for frame, timestamp in frames_buffer), maxlen=frames_buffer.maxlen)
+
+def toggle_compact_buffer(icon_instance=None, item=None):
+    global compact_buffer
+    compact_buffer = not compact_buffer # record_screen restarts the replay buffer in the new storage
+    save_config()
 
 def record_screen():
-    global frames_buffer, running
+    global frames_buffer, running, compact_buffer
+    setup_dxcam()
     if camera is None: return
+    converter, converting, too_slow = None, compact_buffer, False
     print("Starting screen recording...")
     camera.start(target_fps=FPS)
     last_frame_time = time.time()
@@ -734,8 +925,22 @@ def record_screen():
         if current_time - last_frame_time >= frame_interval:
             try:
                 frame = camera.get_latest_frame()
+                if converting != (compact_buffer and not too_slow):
+                    # A capture must not mix both storages (their crops can differ by a pixel), the replay restarts empty
+                    if converter: converter.flush(wait=True)
+                    with buffer_lock: frames_buffer.clear()
+                    converting = not converting
+                if converting and converter is None: converter = Yuv420Converter() # Only built when compact mode is used
                 if frame is not None:
-                    with buffer_lock: frames_buffer.append((frame, current_time))
+                    if converting: converter.submit(frame, current_time)
+                    else:
+                        with buffer_lock: frames_buffer.append((frame, current_time))
+                if converting and converter.flush() > YUV_MAX_BACKLOG_S * FPS:
+                    # This machine can't convert in real time, frames would pile up in RAM
+                    converter.flush(wait=True)
+                    compact_buffer, converting, too_slow = False, False, True
+                    threading.Thread(target=restore_bgr_buffer, daemon=True).start() # The replay is kept
+                    gui_queue.put((show_notification, "Tampon compact désactivé : conversion trop lente sur ce PC.", 4000))
             except Exception as e: print(f"Error during screen recording: {e}")
         time.sleep(0.001)
     camera.stop(); print("Screen recording stopped.")
@@ -744,6 +949,112 @@ def get_editor_command():
     if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'): return [os.path.join(os.path.dirname(sys.executable), "Tool", "Gif Editor.exe")]
     else: return ["python", "gif_editor.py"]
 
+# --- Warm Editor Host ---
+EDITOR_HOST_STARTUP_TIMEOUT_S = 60 # Time given to the host to import everything and start listening
+EDITOR_HOST_REATTACH_TIMEOUT_S = 2 # A running host that never attached gets this long before it is replaced
+
+class EditorHost:
+    """Keeps one preloaded editor process (gif_editor --host) that opens project windows on request
+    over a local authenticated connection. The connection kept open by attach lets the host
+    notice when the recorder is gone."""
+    def __init__(self):
+        self.process, self.address, self.authkey = None, None, None
+        self._lifeline = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.process and self.process.poll() is None:
+                if self._lifeline: return
+                # Running but not attached (it answered too late): attach now, or replace it
+                if self._attach(time.time() + EDITOR_HOST_REATTACH_TIMEOUT_S): return
+                self.process.kill()
+            self._lifeline = None
+            self.authkey = os.urandom(16)
+            name = f"gif_editor_host_{os.getpid()}_{self.authkey[:4].hex()}"
+            self.address = rf"\\.\pipe\{name}" if sys.platform == 'win32' else os.path.join(tempfile.gettempdir(), name)
+            env = dict(os.environ, GIF_EDITOR_HOST=f"{self.address}|{self.authkey.hex()}")
+            try:
+                self.process = subprocess.Popen(get_editor_command() + ['--host'], env=env)
+            except Exception as e:
+                print(f"DEBUG: Editor host not started: {e}")
+                self.process = None
+                return
+            if not self._attach(time.time() + EDITOR_HOST_STARTUP_TIMEOUT_S):
+                print("DEBUG: Editor host did not answer, editors will be cold started.")
+
+    def _attach(self, deadline):
+        while time.time() < deadline and self.process.poll() is None:
+            try:
+                self._lifeline = Client(self.address, authkey=self.authkey)
+                self._lifeline.send({'command': 'attach'})
+                print("DEBUG: Editor host ready.")
+                return True
+            except (OSError, EOFError):
+                time.sleep(0.2)
+        return False
+
+    def open(self, project_path, requested_at, shared=None, on_failure=None):
+        """True when the request reached the host, False when the caller has to start an editor itself.
+        Doesn't wait for the window: if the host then fails to open the project, on_failure() is called
+        from a background thread."""
+        if not self._lifeline or not self.process or self.process.poll() is not None: return False
+        try:
+            conn = Client(self.address, authkey=self.authkey)
+            conn.send({'command': 'open', 'path': project_path, 'requested_at': requested_at, 'shared': shared})
+        except Exception as e:
+            print(f"DEBUG: Editor host unreachable ({e}), cold start.")
+            return False
+        threading.Thread(target=self._await_open, args=(conn, on_failure), daemon=True).start()
+        return True
+
+    def _await_open(self, conn, on_failure):
+        # The answer is advisory: a slow host still opens its window, only a dropped request falls back
+        try:
+            with conn:
+                if conn.recv().get('opened'): return
+        except (EOFError, OSError): pass
+        print("DEBUG: Editor host could not open the project, cold start.")
+        if on_failure: on_failure()
+
+    def stop(self):
+        # Editor windows still open in the host stay open, it exits after the last one
+        if self._lifeline:
+            try: self._lifeline.close()
+            except OSError: pass
+            self._lifeline = None
+
+editor_host = EditorHost()
+
+def launch_editor(project_path, shared=None):
+    """Opens a project in the warm editor host, or in a new editor process when the host is not available.
+    shared is the descriptor of frames published with publish_shared_frames()."""
+    requested_at = time.time()
+    if editor_host.open(project_path, requested_at, shared, on_failure=lambda: cold_start_editor(project_path, shared, requested_at)): return
+    cold_start_editor(project_path, shared, requested_at)
+
+def cold_start_editor(project_path, shared, requested_at):
+    # A new interpreter imports everything before the first frame
+    arguments = ['--shared', project_path, json.dumps(shared)] if shared else [project_path]
+    subprocess.Popen(get_editor_command() + arguments, env=dict(os.environ, GIF_EDITOR_REQUESTED_AT=str(requested_at)))
+    threading.Thread(target=editor_host.start, daemon=True).start() # Warm again for the next click
+
+# --- Edit Now (shared memory handoff) ---
+SHARED_FRAMES_GRACE_S = 120 # The segment stays published this long after the JPGs are written, for a cold-started editor to attach
+edit_after_capture = False
+
+def release_shared_frames(memory):
+    # The editor keeps its own mapping, releasing ours only drops the name
+    try:
+        memory.close()
+        memory.unlink()
+    except Exception as e: print(f"DEBUG: Shared frames release: {e}")
+
+def toggle_edit_after_capture(icon_instance=None, item=None):
+    global edit_after_capture
+    edit_after_capture = not edit_after_capture
+    save_config()
+
 def _process_hotkey_action(source='keyboard'):
     global frames_buffer, is_selecting_region, projects_path, camera, manual_capture_in_progress
     
@@ -780,10 +1091,9 @@ def _process_hotkey_action(source='keyboard'):
             if (crop_w < 1): crop_w = 1
             if (crop_h < 1): crop_h = 1
             for frame in frames_to_process:
-                h, w, _ = frame.shape
-                cx1, cy1, cx2, cy2 = max(0, crop_x), max(0, crop_y), min(w, crop_x + crop_w), min(h, crop_y + crop_h)
-                if (cy2 - cy1) > 0 and (cx2 - cx1) > 0:
-                    cropped_frames.append(frame[cy1:cy2, cx1:cx2])
+                cropped = crop_buffered_frame(frame, crop_x, crop_y, crop_x + crop_w, crop_y + crop_h)
+                if cropped is not None:
+                    cropped_frames.append(cropped)
         else: # Full screen capture, no cropping needed
             cropped_frames = frames_to_process
         if not cropped_frames: print("DEBUG: No valid frames after processing."); return
@@ -791,12 +1101,34 @@ def _process_hotkey_action(source='keyboard'):
             proj_dir_name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             project_full_path = os.path.join(projects_path, proj_dir_name)
             os.makedirs(project_full_path, exist_ok=True)
-            for i, frame in enumerate(cropped_frames):
-                frame_path = os.path.join(project_full_path, f"{i:04d}.jpg")
-                rgb_frame = frame[..., ::-1]
-                imageio.imwrite(frame_path, rgb_frame)
-            print(f"Successfully saved {len(cropped_frames)} frames to {project_full_path}")
-            gui_queue.put((open_project_gallery_gui,))
+            shared_memory, rgb_frames = None, None
+            if edit_after_capture:
+                try:
+                    # The editor opens on the frames in RAM, the JPGs below are only written to keep the project
+                    from gif_engine import publish_shared_frames
+                    shared_memory, rgb_frames, descriptor = publish_shared_frames(cropped_frames, bgr=True)
+                    launch_editor(project_full_path, shared=descriptor)
+                except Exception as e:
+                    print(f"DEBUG: Edit now unavailable, saving first: {e}")
+                    rgb_frames = None # Must not point into the segment any more when it is closed
+                    if shared_memory: release_shared_frames(shared_memory)
+                    shared_memory = None
+            try:
+                import imageio.v2 as imageio
+                for i, frame in enumerate(rgb_frames if rgb_frames is not None else cropped_frames):
+                    frame_path = os.path.join(project_full_path, f"{i:04d}.jpg")
+                    rgb_frame = frame if rgb_frames is not None else frame_to_rgb(frame)
+                    imageio.imwrite(frame_path, rgb_frame)
+                print(f"Successfully saved {len(cropped_frames)} frames to {project_full_path}")
+            finally:
+                # Released even when the JPGs could not be written, the segment holds the whole clip
+                if shared_memory:
+                    frame = rgb_frame = rgb_frames = None # Nothing may point into the segment when it is closed
+                    release_timer = threading.Timer(SHARED_FRAMES_GRACE_S, release_shared_frames, args=(shared_memory,))
+                    release_timer.daemon = True
+                    release_timer.start()
+            if not shared_memory:
+                gui_queue.put((open_project_gallery_gui,))
         except Exception as e: print(f"Error saving frames to project folder: {e}")
     finally:
         manual_capture_in_progress = False
@@ -873,12 +1205,14 @@ def exit_application():
     if mouse_listener: mouse_listener.stop()
     if hotkey_listener: hotkey_listener.stop()
 
+    editor_host.stop()
     if icon:
         icon.stop()
     gui_queue.put((root_for_windows.destroy,))
 
 def hotkey_listener_thread():
     global hotkey_listener
+    from pynput import keyboard
     
     def on_activate_hotkey():
         on_hotkey_pressed(source='keyboard')
@@ -898,6 +1232,7 @@ def hotkey_listener_thread():
 
 def monitor_input_events():
     global kpm_events_history, pressed_keys, pressed_mouse_buttons, keyboard_listener, mouse_listener, running
+    from pynput import keyboard, mouse
 
     def on_press(key):
         if key not in pressed_keys:
@@ -935,10 +1270,20 @@ def monitor_input_events():
 def _start_drag(event): global drag_start_x, drag_start_y; drag_start_x, drag_start_y = event.x, event.y
 def _do_drag(event): global shortcut_window; shortcut_window.geometry(f"+{shortcut_window.winfo_x() - drag_start_x + event.x}+{shortcut_window.winfo_y() - drag_start_y + event.y}")
 
+SHORTCUT_ICON_SIZE = (40, 40)
+_icon_photos = {} # path -> PhotoImage, reused each time the shortcut window is shown
+
 def _load_or_create_icon(path, text, color):
     """Loads an icon from path, or creates a placeholder if not found."""
+    if path in _icon_photos: return _icon_photos[path]
+    _icon_photos[path] = _create_icon(path, text, color)
+    return _icon_photos[path]
+
+def _create_icon(path, text, color):
+    from PIL import ImageDraw, ImageFont
     try:
-        img = Image.open(path).resize((40, 40), Image.LANCZOS)
+        # The source images are large (eye.png is 2396px), the resized copy is cached on disk
+        img = gif_startup.load_sized_icon(path, SHORTCUT_ICON_SIZE)
         return ImageTk.PhotoImage(img)
     except FileNotFoundError:
         print(f"Warning: Icon file not found at {path}. Creating placeholder.")
@@ -1040,6 +1385,8 @@ def setup_tray_icon():
     return Icon("Gif Recorder", icon_image, menu=Menu(
         MenuItem('Afficher Raccourci de Capture', toggle_shortcut_window, checked=lambda item: is_shortcut_window_visible),
         MenuItem('Ouvrir la galerie des projets', lambda: gui_queue.put((open_project_gallery_gui,))),
+        MenuItem('Éditer directement après capture', toggle_edit_after_capture, checked=lambda item: edit_after_capture),
+        MenuItem('Tampon compact (YUV 4:2:0, 2x moins de RAM)', toggle_compact_buffer, checked=lambda item: compact_buffer),
         MenuItem('Configurer l\'Auto-Watch', lambda: gui_queue.put((open_autowatch_config_gui,))),
         Menu.SEPARATOR,
         MenuItem('Mode de Capture', Menu(duration_menu_items)),
@@ -1049,7 +1396,7 @@ def setup_tray_icon():
 
 # --- Config and Main Execution ---
 def load_config():
-    global current_record_duration, shortcut_window_x, shortcut_window_y, projects_path, selected_monitor_index, capture_mode, autowatch_rules
+    global current_record_duration, shortcut_window_x, shortcut_window_y, projects_path, selected_monitor_index, capture_mode, autowatch_rules, edit_after_capture, compact_buffer
     default_projects_path = os.path.join(os.path.expanduser('~'), 'GifRecorderProjects')
     try:
         if os.path.exists('config.json'):
@@ -1062,6 +1409,8 @@ def load_config():
                 selected_monitor_index = config.get('monitor_index', 0)
                 capture_mode = config.get('capture_mode', 'replay')
                 autowatch_rules = config.get('autowatch_rules', [])
+                edit_after_capture = config.get('edit_after_capture', False)
+                compact_buffer = config.get('compact_buffer', False)
                 for rule in autowatch_rules:
                     if 'kpm_threshold' not in rule:
                         rule['kpm_threshold'] = 100
@@ -1090,7 +1439,9 @@ def save_config():
             'record_duration': current_record_duration,
             'monitor_index': selected_monitor_index,
             'capture_mode': capture_mode,
-            'autowatch_rules': autowatch_rules
+            'autowatch_rules': autowatch_rules,
+            'edit_after_capture': edit_after_capture,
+            'compact_buffer': compact_buffer
         }
         if shortcut_window_x is not None: config_data['shortcut_window_x'] = shortcut_window_x
         if shortcut_window_y is not None: config_data['shortcut_window_y'] = shortcut_window_y
@@ -1126,20 +1477,27 @@ def main():
 
     frames_buffer = deque(maxlen=int(current_record_duration * FPS))
     cleanup_old_gifs()
+    gif_startup.mark("config")
     root_for_windows = tk.Tk()
     root_for_windows.attributes('-toolwindow', True)
     root_for_windows.withdraw()
     gui_queue.put((display_splash_screen_gui,))
-    setup_dxcam()
+    gif_startup.mark("tk root")
     threading.Thread(target=record_screen, daemon=True).start()
     threading.Thread(target=hotkey_listener_thread, daemon=True).start()
     threading.Thread(target=autowatch_thread_func, daemon=True).start()
     threading.Thread(target=monitor_input_events, daemon=True).start()
+    gif_startup.mark("threads")
     icon = setup_tray_icon()
     threading.Thread(target=icon.run, daemon=True).start()
+    gif_startup.mark("tray icon")
     process_gui_queue()
+    # After the splash screen, so the host's imports don't slow down startup
+    root_for_windows.after(SPLASH_SCREEN_DURATION_MS, lambda: threading.Thread(target=editor_host.start, daemon=True).start())
     gui_queue.put((show_shortcut_window_gui,))
     periodic_gui_update()
+    # Splash and shortcut window are drawn once the queued calls have run
+    root_for_windows.after_idle(lambda: (gif_startup.mark("first window"), gif_startup.report("gif_recorder")))
     root_for_windows.mainloop()
     print("Mainloop finished. Exiting.")
 
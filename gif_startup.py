@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import time
+
+# Startup helpers of the recorder and the editor. This module is imported first by both,
+# so it must stay free of heavy imports.
+_started = time.perf_counter()
+
+# --- Configuration ---
+PROFILE_FLAG = "--profile-startup"
+ICON_CACHE_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or tempfile.gettempdir(), "Gif Recorder", "icon_cache")
+
+profiling = PROFILE_FLAG in sys.argv
+if profiling: sys.argv.remove(PROFILE_FLAG) # The editor reads its file from sys.argv[1]
+_phases = []
+
+
+# --- Startup Profile ---
+def mark(phase):
+    """Ends a startup phase. Its duration is the time since the previous mark."""
+    if profiling: _phases.append((phase, time.perf_counter()))
+
+def report(program):
+    """Prints the per-phase breakdown once (to a temp file for windowed builds), then stops profiling."""
+    global profiling
+    if not profiling: return
+    profiling = False
+    lines, previous = [f"--- {program}: startup profile (from the first import) ---"], _started
+    for phase, at in _phases:
+        lines.append(f"{phase:<24} {(at - previous) * 1000:8.1f} ms")
+        previous = at
+    lines.append(f"{'total':<24} {(previous - _started) * 1000:8.1f} ms")
+    text = "\n".join(lines)
+    if sys.stdout:
+        print(text, flush=True)
+    else:
+        with open(os.path.join(tempfile.gettempdir(), f"{program}_startup_profile.txt"), 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+# --- Icons ---
+def load_sized_icon(path, size):
+    """PIL image of path resized to size. The resized copy is kept in ICON_CACHE_DIR, so a large
+    source image is only decoded and resampled once, not at every start."""
+    from PIL import Image
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached_path = os.path.join(ICON_CACHE_DIR, f"{name}_{size[0]}x{size[1]}_{stat.st_size}_{stat.st_mtime_ns}.png")
+    try:
+        image = Image.open(cached_path)
+        image.load()
+        return image
+    except OSError:
+        pass
+    image = Image.open(path).resize(size, Image.LANCZOS)
+    try:
+        os.makedirs(ICON_CACHE_DIR, exist_ok=True)
+        image.save(cached_path + ".tmp", format="PNG")
+        os.replace(cached_path + ".tmp", cached_path)
+    except OSError as e:
+        print(f"Icon cache not written for {path}: {e}")
+    return image